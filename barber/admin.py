@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Barber, Service, Client, Booking, Income, RegistrationRequest
+from .models import Barber, Service, Client, Booking, Income, RegistrationRequest, SmsOutbox
 from django.utils import timezone
 
 @admin.register(Barber)
@@ -33,6 +33,13 @@ class IncomeAdmin(admin.ModelAdmin):
     list_filter = ['barber', 'payment_method', 'date', 'is_walkin']
     date_hierarchy = 'date'
 
+@admin.register(SmsOutbox)
+class SmsOutboxAdmin(admin.ModelAdmin):
+    list_display = ['phone', 'kind', 'barber', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'kind', 'barber']
+    search_fields = ['phone']
+    readonly_fields = ['lease_token', 'lease_expires_at', 'last_error', 'created_at', 'sent_at']
+
 
 @admin.register(RegistrationRequest)
 class RegistrationRequestAdmin(admin.ModelAdmin):
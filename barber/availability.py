@@ -0,0 +1,371 @@
+import math
+import uuid
+from datetime import datetime, timedelta, time as dt_time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.utils import timezone
+from .cacheversions import bump_version, get_versions
+from .models import Booking, BookingDayLock, SlotHold
+
+# Length of the step between offered start times
+SLOT_INTERVAL_MINUTES = 30
+
+# How far ahead clients may book on the public page
+BOOKING_WINDOW_DAYS = 14
+
+# Bookings in these states occupy the barber's chair
+ACTIVE_BOOKING_STATUSES = ['pending', 'confirmed', 'in_progress']
+
+# Computed slots are cached per barber/day; bookings invalidate them on write
+AVAILABILITY_CACHE_TIMEOUT = getattr(settings, 'AVAILABILITY_CACHE_TIMEOUT', 60 * 60)
+
+# Seconds a slot stays held for a client who is filling in the booking form
+SLOT_HOLD_SECONDS = getattr(settings, 'SLOT_HOLD_SECONDS', 5 * 60)
+
+# Live holds allowed per barber from one client address, and for a barber in total,
+# so nobody can hold the whole booking window by discarding their session
+SLOT_HOLDS_PER_CLIENT = getattr(settings, 'SLOT_HOLDS_PER_CLIENT', 2)
+SLOT_HOLDS_PER_BARBER = getattr(settings, 'SLOT_HOLDS_PER_BARBER', 20)
+
+# Hit/miss counters live in the cache itself so every worker adds to the same totals
+_STATS_KEYS = {'hits': 'availability:stats:hits', 'misses': 'availability:stats:misses'}
+
+
+class SlotUnavailable(Exception):
+    """Raised when a booking overlaps an appointment that is already reserved"""
+
+
+class HoldLimitReached(Exception):
+    """Raised when a client or barber already has the maximum number of live holds"""
+
+
+def _version_key(barber_id, date_obj):
+    return f"availability:version:{barber_id}:{date_obj}"
+
+
+def _slots_key(barber, date_obj, duration_minutes, version):
+    # Working hours are part of the key so settings changes never serve stale slots
+    return (
+        f"availability:slots:{barber.pk}:{date_obj}:{version}:"
+        f"{duration_minutes}:{barber.work_start_time}:{barber.work_end_time}"
+    )
+
+
+def _get_versions(barber_id, dates):
+    """Current cache version for each day, creating missing ones in one round trip"""
+    keys = {_version_key(barber_id, d): d for d in dates}
+    return {keys[key]: version for key, version in get_versions(list(keys)).items()}
+
+
+def invalidate_availability(barber_id, date_obj):
+    """
+    Drop every cached slot list for a barber/day by bumping its version once
+    the current transaction commits. Bumping earlier would let a concurrent
+    reader cache the old rows under the new version.
+    """
+    if date_obj is None:
+        return
+    key = _version_key(barber_id, date_obj)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def _count_lookups(name, amount):
+    if not amount:
+        return
+    key = _STATS_KEYS[name]
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # First count since the cache was cleared; add() loses to a concurrent creator harmlessly
+        cache.add(key, 0, None)
+        cache.incr(key, amount)
+
+
+def get_availability_cache_stats():
+    """Hit/miss counters for the slot cache, summed over all processes sharing the cache"""
+    found = cache.get_many(_STATS_KEYS.values())
+    hits = found.get(_STATS_KEYS['hits'], 0)
+    misses = found.get(_STATS_KEYS['misses'], 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_availability_cache_stats():
+    """Start the hit/miss counters from zero"""
+    cache.delete_many(_STATS_KEYS.values())
+
+
+def _day_bounds(start_date, end_date):
+    """Aware datetimes spanning midnight of start_date to midnight after end_date"""
+    return (
+        timezone.make_aware(datetime.combine(start_date, dt_time.min)),
+        timezone.make_aware(datetime.combine(end_date + timedelta(days=1), dt_time.min)),
+    )
+
+
+def _overlapping_bookings(barber, range_start, range_end):
+    """Active bookings whose [start, end) interval intersects the range"""
+    return Booking.objects.filter(
+        barber=barber,
+        appointment_start__lt=range_end,
+        appointment_end__gt=range_start,
+        status__in=ACTIVE_BOOKING_STATUSES
+    ).order_by('appointment_start').values_list('appointment_start', 'appointment_end')
+
+
+def _active_holds(barber, range_start, range_end, now):
+    """Unexpired slot holds whose [start, end) interval intersects the range"""
+    return SlotHold.objects.filter(
+        barber=barber,
+        appointment_start__lt=range_end,
+        appointment_end__gt=range_start,
+        expires_at__gt=now
+    )
+
+
+def get_busy_intervals_for_range(barber, start_date, end_date):
+    """
+    Load busy intervals (active bookings and live holds) for a date range,
+    grouped by every day they touch. Also returns the earliest hold expiry
+    per day, after which that day's computed slots go stale.
+    """
+    range_start, range_end = _day_bounds(start_date, end_date)
+    bookings = _overlapping_bookings(barber, range_start, range_end).order_by().values_list(
+        'appointment_start', 'appointment_end', Value(None, output_field=DateTimeField())
+    )
+    holds = _active_holds(barber, range_start, range_end, timezone.now()).values_list(
+        'appointment_start', 'appointment_end', 'expires_at'
+    )
+    # One round trip for both sources
+    intervals = bookings.union(holds, all=True).order_by('appointment_start')
+
+    busy_by_date = {}
+    expiry_by_date = {}
+    for start, end, expires_at in intervals:
+        day = max(timezone.localtime(start).date(), start_date)
+        last_day = min(timezone.localtime(end - timedelta(microseconds=1)).date(), end_date)
+        while day <= last_day:
+            busy_by_date.setdefault(day, []).append((start, end))
+            if expires_at is not None and (day not in expiry_by_date or expires_at < expiry_by_date[day]):
+                expiry_by_date[day] = expires_at
+            day += timedelta(days=1)
+    return busy_by_date, expiry_by_date
+
+
+def _cache_timeout(hold_expiry):
+    """Keep a day cached no longer than its first hold lives"""
+    if hold_expiry is None:
+        return AVAILABILITY_CACHE_TIMEOUT
+    remaining = math.ceil((hold_expiry - timezone.now()).total_seconds())
+    return max(1, min(AVAILABILITY_CACHE_TIMEOUT, remaining))
+
+
+def compute_free_slots(date_obj, work_start, work_end, duration_minutes, busy_intervals):
+    """
+    Sweep the working day and return every free start time as 'HH:MM'.
+    busy_intervals must be sorted by start; a slot is taken if it intersects any of them.
+    """
+    free_slots = []
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=SLOT_INTERVAL_MINUTES)
+
+    current_time = timezone.make_aware(datetime.combine(date_obj, work_start))
+    end_time = timezone.make_aware(datetime.combine(date_obj, work_end))
+    idx = 0
+    latest_end = None
+
+    while current_time < end_time:
+        slot_end = current_time + duration
+        # Slot ends only grow, so every interval starting before one stays relevant
+        while idx < len(busy_intervals) and busy_intervals[idx][0] < slot_end:
+            if latest_end is None or busy_intervals[idx][1] > latest_end:
+                latest_end = busy_intervals[idx][1]
+            idx += 1
+        if latest_end is None or latest_end <= current_time:
+            free_slots.append(current_time.strftime('%H:%M'))
+        current_time += step
+
+    return free_slots
+
+
+def _upcoming(date_obj, slots, now):
+    """
+    Drop start times that have already passed. Cached lists are computed
+    without the clock, so this runs on every read; only today is trimmed.
+    """
+    today = timezone.localdate(now)
+    if date_obj > today:
+        return slots
+    if date_obj < today:
+        return []
+    current = timezone.localtime(now).strftime('%H:%M')
+    return [slot for slot in slots if slot > current]
+
+
+def get_available_slots(barber, date_obj, service):
+    """Free start times for a service on a given day, served from cache when possible"""
+    version = _get_versions(barber.pk, [date_obj])[date_obj]
+    key = _slots_key(barber, date_obj, service.duration_minutes, version)
+
+    slots = cache.get(key)
+    if slots is not None:
+        _count_lookups('hits', 1)
+        return _upcoming(date_obj, slots, timezone.now())
+
+    _count_lookups('misses', 1)
+    busy_by_date, expiry_by_date = get_busy_intervals_for_range(barber, date_obj, date_obj)
+    slots = compute_free_slots(
+        date_obj,
+        barber.work_start_time,
+        barber.work_end_time,
+        service.duration_minutes,
+        busy_by_date.get(date_obj, []),
+    )
+    cache.set(key, slots, _cache_timeout(expiry_by_date.get(date_obj)))
+    return _upcoming(date_obj, slots, timezone.now())
+
+
+def get_available_days(barber, service, start_date, days=BOOKING_WINDOW_DAYS):
+    """
+    Free start times for every day in the booking window, keyed by date.
+    Cached days are reused; the rest come from a single range query.
+    """
+    dates = [start_date + timedelta(days=offset) for offset in range(days + 1)]
+    versions = _get_versions(barber.pk, dates)
+    keys = {
+        d: _slots_key(barber, d, service.duration_minutes, versions[d])
+        for d in dates
+    }
+    cached = cache.get_many(keys.values())
+
+    available_days = {}
+    missing = []
+    for d in dates:
+        if keys[d] in cached:
+            available_days[d] = cached[keys[d]]
+        else:
+            missing.append(d)
+
+    _count_lookups('hits', len(dates) - len(missing))
+    _count_lookups('misses', len(missing))
+
+    if missing:
+        busy_by_date, expiry_by_date = get_busy_intervals_for_range(barber, missing[0], missing[-1])
+        computed = {}
+        for d in missing:
+            available_days[d] = compute_free_slots(
+                d,
+                barber.work_start_time,
+                barber.work_end_time,
+                service.duration_minutes,
+                busy_by_date.get(d, []),
+            )
+            if d in expiry_by_date:
+                cache.set(keys[d], available_days[d], _cache_timeout(expiry_by_date[d]))
+            else:
+                computed[keys[d]] = available_days[d]
+        cache.set_many(computed, AVAILABILITY_CACHE_TIMEOUT)
+
+    now = timezone.now()
+    return {d: _upcoming(d, available_days[d], now) for d in dates}
+
+
+def _lock_barber_day(barber, date_obj):
+    """
+    Take the write lock on the barber's lock row for the day.
+    Only bookings for the same barber and day wait on each other.
+    """
+    lock, created = BookingDayLock.objects.get_or_create(barber=barber, date=date_obj)
+    BookingDayLock.objects.filter(pk=lock.pk).update(version=F('version') + 1)
+
+
+def _is_taken(barber, start, end, now, booking_pk=None, hold_token=None):
+    """True if an active booking or someone else's live hold overlaps [start, end)"""
+    bookings = _overlapping_bookings(barber, start, end)
+    if booking_pk:
+        bookings = bookings.exclude(pk=booking_pk)
+    holds = _active_holds(barber, start, end, now)
+    if hold_token:
+        holds = holds.exclude(token=hold_token)
+    return bookings.exists() or holds.exists()
+
+
+def _release_hold(barber, token):
+    """Delete a hold and refresh availability for its day"""
+    hold = SlotHold.objects.filter(barber=barber, token=token).first()
+    if hold:
+        hold.delete()
+        invalidate_availability(barber.pk, timezone.localtime(hold.appointment_start).date())
+
+
+def _check_offered(barber, service, date_obj, time_obj, start, now):
+    """Raise ValueError unless the start is one the booking page offers: on the grid, in hours and in the window"""
+    today = timezone.localdate(now)
+    if not today <= date_obj <= today + timedelta(days=BOOKING_WINDOW_DAYS) or start <= now:
+        raise ValueError(f"{date_obj} {time_obj} is outside the booking window")
+    offered = compute_free_slots(date_obj, barber.work_start_time, barber.work_end_time, service.duration_minutes, [])
+    if time_obj.strftime('%H:%M') not in offered:
+        raise ValueError(f"{time_obj} is not an offered start time")
+
+
+def hold_slot(barber, service, date_obj, time_obj, replace_token=None, client_ip=None):
+    """
+    Hold a slot for SLOT_HOLD_SECONDS while the client completes the form.
+    Expired holds for the barber are reclaimed here, so no periodic sweep
+    is needed. Raises ValueError for a time the booking page would not
+    offer, HoldLimitReached past the hold caps, and SlotUnavailable if the
+    slot is booked or held.
+    """
+    start = timezone.make_aware(datetime.combine(date_obj, time_obj))
+    end = start + timedelta(minutes=service.duration_minutes)
+    now = timezone.now()
+    _check_offered(barber, service, date_obj, time_obj, start, now)
+
+    with transaction.atomic():
+        _lock_barber_day(barber, date_obj)
+        SlotHold.objects.filter(barber=barber, expires_at__lte=now).delete()
+        if replace_token:
+            _release_hold(barber, replace_token)
+        live = SlotHold.objects.filter(barber=barber)
+        if client_ip and live.filter(client_ip=client_ip).count() >= SLOT_HOLDS_PER_CLIENT:
+            raise HoldLimitReached(f"{client_ip} already holds {SLOT_HOLDS_PER_CLIENT} slot(s)")
+        if live.count() >= SLOT_HOLDS_PER_BARBER:
+            raise HoldLimitReached(f"{barber} already has {SLOT_HOLDS_PER_BARBER} slot(s) held")
+        if _is_taken(barber, start, end, now):
+            raise SlotUnavailable(f"{date_obj} {time_obj} is already booked")
+        hold = SlotHold.objects.create(
+            barber=barber,
+            token=str(uuid.uuid4()),
+            appointment_start=start,
+            appointment_end=end,
+            expires_at=now + timedelta(seconds=SLOT_HOLD_SECONDS),
+            client_ip=client_ip,
+        )
+
+    invalidate_availability(barber.pk, date_obj)
+    return hold
+
+
+def reserve_booking(booking, hold_token=None):
+    """
+    Save the booking only if its interval is still free.
+    The overlap check and the insert run in one transaction under the
+    barber/day lock, so two concurrent requests cannot both take a slot.
+    A hold owned by the client is converted into the booking.
+    """
+    start, end = booking.compute_appointment_interval()
+    with transaction.atomic():
+        if start is not None:
+            _lock_barber_day(booking.barber, booking.appointment_date)
+            if _is_taken(booking.barber, start, end, timezone.now(), booking.pk, hold_token):
+                raise SlotUnavailable(f"{booking.appointment_date} {booking.appointment_time} is already booked")
+        booking.save()
+        if hold_token:
+            _release_hold(booking.barber, hold_token)
+    return booking
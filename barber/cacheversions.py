@@ -0,0 +1,34 @@
+import time
+from django.core.cache import cache as default_cache
+
+# Cached data is keyed by a version that writers bump instead of deleting entries.
+# Versions start from a nanosecond timestamp, so one created after the cache lost
+# a key can never match a version handed out before.
+
+
+def get_version(key, cache=default_cache):
+    """Current version stored under key, creating it if the cache has none"""
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(keys, cache=default_cache):
+    """Current version for each key, creating missing ones in one round trip"""
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return found
+
+
+def bump_version(key, cache=default_cache):
+    """Move key to a new version, orphaning everything cached under the old one"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
@@ -0,0 +1,152 @@
+import calendar
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth
+from .cacheversions import bump_version, get_version
+from .models import DailyIncomeRollup
+
+# Cache alias for dashboard data; use a shared backend (file, database, Redis) for several workers
+DASHBOARD_CACHE_ALIAS = getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')
+
+# Seconds current-period stats stay cached (income writes invalidate them earlier)
+DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60 * 60)
+
+# Seconds a finished month's summary stays cached, it only changes if back-dated income arrives
+PAST_MONTH_CACHE_TIMEOUT = getattr(settings, 'PAST_MONTH_CACHE_TIMEOUT', 30 * 24 * 60 * 60)
+
+# Number of months shown on the income chart
+CHART_MONTHS = 6
+
+
+def _cache():
+    return caches[DASHBOARD_CACHE_ALIAS]
+
+
+def _version_key(barber_id):
+    return f"dashboard:version:{barber_id}"
+
+
+def _month_version_key(barber_id, month_start):
+    return f"dashboard:month-version:{barber_id}:{month_start:%Y-%m}"
+
+
+def invalidate_dashboard(barber_id, dates=()):
+    """
+    Drop the barber's cached current-period stats and the summaries of the
+    months the given dates fall in, once the current transaction commits.
+    """
+    months = {d.replace(day=1) for d in dates if d}
+
+    def bump():
+        bump_version(_version_key(barber_id), _cache())
+        for month_start in months:
+            bump_version(_month_version_key(barber_id, month_start), _cache())
+
+    transaction.on_commit(bump)
+
+
+def _service_counts(counts):
+    """Template-friendly service breakdown, same shape as values('service__name').annotate(count=...)"""
+    return [
+        {'service__name': name, 'count': count}
+        for name, count in sorted(counts.items(), key=lambda item: (item[0] is None, item[0] or ''))
+        if count
+    ]
+
+
+def get_period_stats(barber, today):
+    """
+    Income totals and service breakdowns for today, this week and this month.
+    One grouped query over the daily rollup covers all three periods.
+    """
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    periods = {
+        'daily': Q(date=today),
+        'weekly': Q(date__gte=week_start),
+        'monthly': Q(date__gte=month_start),
+    }
+
+    annotations = {}
+    for period, condition in periods.items():
+        annotations[f'{period}_count'] = Sum('count', filter=condition)
+        annotations[f'{period}_total'] = Sum('total', filter=condition)
+
+    rows = list(
+        DailyIncomeRollup.objects.filter(barber=barber, date__gte=min(week_start, month_start))
+        .values('service__name')
+        .annotate(**annotations)
+        .order_by('service__name')
+    )
+
+    stats = {}
+    for period in periods:
+        stats[f'{period}_income'] = sum(row[f'{period}_total'] or 0 for row in rows)
+        stats[f'{period}_services'] = _service_counts(
+            {row['service__name']: row[f'{period}_count'] or 0 for row in rows}
+        )
+    return stats
+
+
+def get_income_chart(barber, today, months=CHART_MONTHS):
+    """Labels and totals for the last few months, bucketed with TruncMonth over the daily rollup"""
+    month_starts = [today.replace(day=1)]
+    while len(month_starts) < months:
+        month_starts.insert(0, (month_starts[0] - timedelta(days=1)).replace(day=1))
+
+    totals = dict(
+        DailyIncomeRollup.objects.filter(barber=barber, date__gte=month_starts[0])
+        .annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(month_total=Sum('total'))
+        .order_by('month')
+        .values_list('month', 'month_total')
+    )
+
+    labels = [f"{calendar.month_abbr[m.month]} {m:%y}" for m in month_starts]
+    data = [float(totals[m]) if totals.get(m) else 0 for m in month_starts]
+    return labels, data
+
+
+def get_dashboard_stats(barber, today):
+    """Stat cards and chart for the dashboard, cached until the barber's income changes"""
+    cache = _cache()
+    key = f"dashboard:stats:{barber.pk}:{today}:{get_version(_version_key(barber.pk), _cache())}"
+    stats = cache.get(key)
+    if stats is None:
+        chart_labels, chart_data = get_income_chart(barber, today)
+        stats = {
+            **get_period_stats(barber, today),
+            'chart_labels': chart_labels,
+            'chart_data': chart_data,
+        }
+        cache.set(key, stats, DASHBOARD_CACHE_TIMEOUT)
+    return stats
+
+
+def get_cached_month_summary(barber, month_start, month_end, today):
+    """get_month_summary, cached per month; finished months are kept much longer"""
+    cache = _cache()
+    version = get_version(_month_version_key(barber.pk, month_start), _cache())
+    key = f"dashboard:month:{barber.pk}:{month_start:%Y-%m}:{version}"
+    summary = cache.get(key)
+    if summary is None:
+        summary = get_month_summary(barber, month_start, month_end)
+        timeout = PAST_MONTH_CACHE_TIMEOUT if month_end < today else DASHBOARD_CACHE_TIMEOUT
+        cache.set(key, summary, timeout)
+    return summary
+
+
+def get_month_summary(barber, month_start, month_end):
+    """Total income and service breakdown for a month, from the daily rollup"""
+    rows = list(
+        DailyIncomeRollup.objects.filter(barber=barber, date__gte=month_start, date__lte=month_end)
+        .values('service__name')
+        .annotate(service_count=Sum('count'), service_total=Sum('total'))
+        .order_by('service__name')
+    )
+    total = sum(row['service_total'] for row in rows)
+    return total, _service_counts({row['service__name']: row['service_count'] for row in rows})
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .cacheversions import bump_version, get_version
+
+# Dotted path of the broker class; swap in a shared broker (e.g. Redis pub/sub) for several workers
+QUEUE_EVENT_BROKER = getattr(settings, 'QUEUE_EVENT_BROKER', 'barber.events.InProcessBroker')
+
+# Maximum events buffered for a slow subscriber before new ones are dropped
+SUBSCRIBER_BUFFER_SIZE = 100
+
+
+class Subscription:
+    """Events for one connected client, delivered on the event loop that created it"""
+
+    def __init__(self, barber_id):
+        self.barber_id = barber_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER_SIZE)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InProcessBroker:
+    """
+    Fans queue events out to subscribers connected to this process.
+    publish() may be called from any thread, subscribers read from the ASGI event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, barber_id):
+        subscription = Subscription(barber_id)
+        with self._lock:
+            self._subscriptions.setdefault(barber_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.barber_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.barber_id, None)
+
+    def publish(self, barber_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(barber_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has closed, it will unsubscribe on its way out
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(QUEUE_EVENT_BROKER)()
+    return _broker
+
+
+def is_asgi_request(request):
+    """Whether the request came in through ASGI; under WSGI an endless event stream would hold a worker forever"""
+    return isinstance(request, ASGIRequest)
+
+
+def queue_event_type(previous_status, status):
+    """Name of the queue event caused by a booking moving between statuses, or None"""
+    if status == 'waiting':
+        return 'moved' if previous_status == 'waiting' else 'added'
+    if status == 'in_progress':
+        return 'started' if previous_status != 'in_progress' else None
+    if previous_status in ('waiting', 'in_progress'):
+        return 'completed' if status == 'completed' else 'removed'
+    return None
+
+
+def serialize_booking(booking):
+    return {
+        'id': booking.pk,
+        'status': booking.status,
+        'client_name': booking.get_client_name(),
+        'queue_position': booking.queue_position,
+        'service': booking.service.name if booking.service else None,
+        'duration_minutes': booking.service.duration_minutes if booking.service else None,
+        'timer_started_at': booking.timer_started_at.isoformat() if booking.timer_started_at else None,
+        'timer_ended_at': booking.timer_ended_at.isoformat() if booking.timer_ended_at else None,
+    }
+
+
+def _queue_version_key(barber_id):
+    return f"queue:version:{barber_id}"
+
+
+def get_queue_version(barber_id):
+    """Current version of the barber's queue, changes whenever a queue event is published"""
+    return get_version(_queue_version_key(barber_id))
+
+
+def bump_queue_version(barber_id):
+    bump_version(_queue_version_key(barber_id))
+
+
+def publish_queue_event(barber_id, event_type, data=None):
+    """
+    Send a queue event to the barber's subscribers and bump the queue version
+    once the current transaction commits.
+    """
+    event = {'type': event_type, 'barber': barber_id, **(data or {})}
+
+    def publish():
+        bump_queue_version(barber_id)
+        get_broker().publish(barber_id, event)
+
+    transaction.on_commit(publish)
@@ -0,0 +1,140 @@
+import csv
+from datetime import date, datetime, timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from .models import Booking, Income
+
+# Rows fetched from the database per round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+# CSV lines handed to the event loop at a time when streaming under ASGI
+ASYNC_STREAM_LINES = 500
+
+INCOME_HEADER = [
+    'Date', 'Client', 'Phone', 'Service', 'Amount', 'Payment Method',
+    'Walk-in', 'Credit Paid', 'Credit Paid Date',
+]
+
+BOOKING_HEADER = [
+    'Date', 'Time', 'Client', 'Phone', 'Service', 'Status',
+    'Walk-in', 'Started', 'Ended',
+]
+
+
+class Echo:
+    """File-like object whose write() hands the line back, so csv.writer can feed a stream"""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    """Format a value for the CSV, neutralising text a spreadsheet would run as a formula"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+    value = str(value)
+    if value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+def period_bounds(month=None, year=None, date_from=None, date_to=None):
+    """
+    First and last day to export from 'YYYY-MM', 'YYYY' or explicit dates.
+    Raises ValueError for malformed input.
+    """
+    if month:
+        start = datetime.strptime(month, '%Y-%m').date()
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        return start, end
+    if year:
+        start = datetime.strptime(year, '%Y').date()
+        return start, date(start.year, 12, 31)
+    start = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else None
+    end = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else None
+    return start, end
+
+
+def income_rows(barber, date_from=None, date_to=None):
+    """Income records in date order, fetched in chunks"""
+    records = Income.objects.filter(barber=barber).select_related('client', 'service')
+    if date_from:
+        records = records.filter(date__gte=date_from)
+    if date_to:
+        records = records.filter(date__lte=date_to)
+
+    for income in records.order_by('date', 'created_at', 'pk').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        client = income.client
+        yield [
+            income.date.isoformat(),
+            f"{client.name} {client.surname}" if client else income.client_name,
+            client.phone if client else '',
+            income.service.name if income.service else '',
+            income.amount,
+            income.get_payment_method_display(),
+            income.is_walkin,
+            income.credit_paid if income.payment_method == 'credit' else None,
+            income.credit_paid_date.isoformat() if income.credit_paid_date else None,
+        ]
+
+
+def booking_rows(barber, date_from=None, date_to=None):
+    """
+    Bookings in the order they were made, fetched in chunks. Appointments are
+    filtered on their appointment date, walk-ins on the day they joined the queue.
+    """
+    bookings = Booking.objects.filter(barber=barber).select_related('client', 'service')
+    if date_from:
+        bookings = bookings.filter(
+            Q(appointment_date__gte=date_from)
+            | Q(appointment_date__isnull=True, added_to_queue_at__date__gte=date_from)
+        )
+    if date_to:
+        bookings = bookings.filter(
+            Q(appointment_date__lte=date_to)
+            | Q(appointment_date__isnull=True, added_to_queue_at__date__lte=date_to)
+        )
+
+    for booking in bookings.order_by('created_at', 'pk').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            booking.appointment_date.isoformat() if booking.appointment_date else timezone.localtime(booking.added_to_queue_at).date().isoformat(),
+            booking.appointment_time.strftime('%H:%M') if booking.appointment_time else '',
+            booking.get_client_name(),
+            booking.get_client_phone(),
+            booking.service.name if booking.service else '',
+            booking.get_status_display(),
+            booking.is_walkin,
+            booking.timer_started_at,
+            booking.timer_ended_at,
+        ]
+
+
+def stream_csv(header, rows):
+    """Yield the CSV one line at a time"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+async def stream_in_thread(lines, chunk_lines=ASYNC_STREAM_LINES):
+    """
+    Async wrapper around a sync line iterator for responses served through ASGI,
+    where Django would otherwise read a sync iterator into a list first. Each
+    chunk is produced in the sync thread, which keeps the database cursor.
+    """
+    next_chunk = sync_to_async(lambda: ''.join(islice(lines, chunk_lines)))
+    while chunk := await next_chunk():
+        yield chunk
+
+
+EXPORTS = {
+    'income': (INCOME_HEADER, income_rows),
+    'bookings': (BOOKING_HEADER, booking_rows),
+}
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import Barber, Service, Client, Booking, Income
+from .availability import BOOKING_WINDOW_DAYS
 from datetime import datetime, timedelta, date
 
 
@@ -145,8 +146,16 @@ class PublicBookingForm(forms.ModelForm):
             
             # Set date limits
             min_date = date.today()
-            max_date = min_date + timedelta(days=14)
+            max_date = min_date + timedelta(days=BOOKING_WINDOW_DAYS)
             self.fields['appointment_date'].widget.attrs.update({
                 'min': min_date.strftime('%Y-%m-%d'),
                 'max': max_date.strftime('%Y-%m-%d'),
-            })
\ No newline at end of file
+            })
+
+class ImportForm(forms.Form):
+    KINDS = [
+        ('clients', 'Clients'),
+        ('income', 'Income history'),
+    ]
+    kind = forms.ChoiceField(choices=KINDS, widget=forms.Select(attrs={'class': 'form-control'}))
+    file = forms.FileField(widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv'}))
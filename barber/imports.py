@@ -0,0 +1,208 @@
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from .models import Client, Income, Service
+from .rollups import rebuild_income_rollup
+
+# Rows validated and written per transaction
+IMPORT_BATCH_SIZE = 1000
+
+CLIENT_COLUMNS = ['name', 'surname', 'phone', 'age_group', 'gender']
+INCOME_COLUMNS = ['date', 'amount', 'payment_method']
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'paid'}
+_FALSE_VALUES = {'', '0', 'false', 'no', 'n', 'unpaid'}
+
+
+class ImportRowError(Exception):
+    """Raised for a problem with one CSV row, or with the header"""
+
+
+class ImportResult:
+    """Counts and per-row errors of an import; line numbers include the header"""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+    def __str__(self):
+        return f"{self.created} created, {len(self.errors)} skipped"
+
+
+def normalise_phone(phone):
+    """Strip spaces, dashes, dots and brackets so the same number always compares equal"""
+    return re.sub(r'[\s\-().]', '', phone or '')
+
+
+def _choice(value, choices, label):
+    """Match a value against a model field's choices by key or display name"""
+    value = value.strip().lower()
+    for key, display in choices:
+        if value in (key, display.lower()):
+            return key
+    raise ImportRowError(f"Unknown {label} '{value}'")
+
+
+def _required(row, column):
+    value = (row.get(column) or '').strip()
+    if not value:
+        raise ImportRowError(f"Missing {column}")
+    return value
+
+
+def _parse_date(value, column):
+    try:
+        return datetime.strptime(value.strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ImportRowError(f"Invalid {column} '{value}', use YYYY-MM-DD")
+
+
+def _parse_bool(value, column):
+    value = (value or '').strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ImportRowError(f"Invalid {column} '{value}'")
+
+
+def _rows(csv_file, columns):
+    """Yield (line number, row dict) from a text stream, checking the header once"""
+    reader = csv.DictReader(csv_file)
+    header = [name.strip().lower() for name in reader.fieldnames or []]
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ImportRowError(f"Missing column(s): {', '.join(missing)}")
+    reader.fieldnames = header
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _build_client(barber, row, phones):
+    phone = normalise_phone(_required(row, 'phone'))
+    if len(phone) > Client._meta.get_field('phone').max_length:
+        raise ImportRowError(f"Phone '{phone}' is too long")
+    if phone in phones:
+        raise ImportRowError(f"A client with phone {phone} already exists")
+    client = Client(
+        barber=barber,
+        name=_required(row, 'name')[:100],
+        surname=_required(row, 'surname')[:100],
+        phone=phone,
+        age_group=_choice(_required(row, 'age_group'), Client.AGE_GROUPS, 'age group'),
+        gender=_choice(_required(row, 'gender'), Client.GENDER_CHOICES, 'gender'),
+    )
+    phones.add(phone)
+    return client
+
+
+def import_clients(barber, csv_file, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create clients from CSV columns name, surname, phone, age_group, gender.
+    Phones are checked against one set of the barber's existing numbers
+    instead of a query per row; duplicates are reported and skipped.
+    """
+    result = ImportResult()
+    phones = {normalise_phone(phone) for phone in Client.objects.filter(barber=barber).values_list('phone', flat=True)}
+
+    for batch in _batches(_rows(csv_file, CLIENT_COLUMNS), batch_size):
+        clients = []
+        for line, row in batch:
+            try:
+                clients.append(_build_client(barber, row, phones))
+            except ImportRowError as e:
+                result.add_error(line, str(e))
+        with transaction.atomic():
+            Client.objects.bulk_create(clients)
+        result.created += len(clients)
+    return result
+
+
+def _build_income(barber, row, services, clients):
+    payment_method = _choice(_required(row, 'payment_method'), Income.PAYMENT_METHODS, 'payment method')
+    try:
+        amount = Decimal(_required(row, 'amount').replace(',', ''))
+    except InvalidOperation:
+        raise ImportRowError(f"Invalid amount '{row['amount']}'")
+    # NaN and sNaN parse, but comparing them raises InvalidOperation
+    if not amount.is_finite() or amount <= 0 or amount.as_tuple().exponent < -2 or amount >= 10 ** 8:
+        raise ImportRowError(f"Invalid amount '{row['amount']}'")
+
+    service_id = None
+    service_name = (row.get('service') or '').strip()
+    if service_name:
+        service_id = services.get(service_name.lower())
+        if service_id is None:
+            raise ImportRowError(f"Unknown service '{service_name}'")
+
+    client_id = None
+    phone = normalise_phone(row.get('client_phone'))
+    if phone:
+        client_id = clients.get(phone)
+        if client_id is None:
+            raise ImportRowError(f"No client with phone {phone}")
+
+    credit_paid = _parse_bool(row.get('credit_paid'), 'credit_paid') if payment_method == 'credit' else False
+    credit_paid_date = None
+    if credit_paid and (row.get('credit_paid_date') or '').strip():
+        credit_paid_date = _parse_date(row['credit_paid_date'], 'credit_paid_date')
+
+    return Income(
+        barber=barber,
+        client_id=client_id,
+        service_id=service_id,
+        client_name=(row.get('client_name') or '').strip()[:200],
+        amount=amount,
+        payment_method=payment_method,
+        is_walkin=client_id is None,
+        credit_paid=credit_paid,
+        credit_paid_date=credit_paid_date,
+        date=_parse_date(_required(row, 'date'), 'date'),
+    )
+
+
+def import_income(barber, csv_file, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create historical income from CSV columns date, amount, payment_method and
+    optionally service (name), client_phone, client_name, credit_paid, credit_paid_date.
+    bulk_create skips Income.save, so each batch rebuilds the rollup for its days.
+    """
+    result = ImportResult()
+    services = {name.lower(): pk for pk, name in Service.objects.filter(barber=barber).values_list('pk', 'name')}
+    clients = {normalise_phone(phone): pk for pk, phone in Client.objects.filter(barber=barber).values_list('pk', 'phone')}
+
+    for batch in _batches(_rows(csv_file, INCOME_COLUMNS), batch_size):
+        records = []
+        for line, row in batch:
+            try:
+                records.append(_build_income(barber, row, services, clients))
+            except ImportRowError as e:
+                result.add_error(line, str(e))
+        with transaction.atomic():
+            Income.objects.bulk_create(records)
+            if records:
+                rebuild_income_rollup(barber_id=barber.pk, dates={income.date for income in records})
+        result.created += len(records)
+    return result
+
+
+IMPORTS = {
+    'clients': import_clients,
+    'income': import_income,
+}
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from barber.availability import get_availability_cache_stats, reset_availability_cache_stats
+
+class Command(BaseCommand):
+    help = 'Show the hit/miss counters of the availability slot cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after showing them')
+
+    def handle(self, *args, **options):
+        stats = get_availability_cache_stats()
+        self.stdout.write(
+            f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit ratio: {stats['hit_ratio']:.1%}"
+        )
+        if options['reset']:
+            reset_availability_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
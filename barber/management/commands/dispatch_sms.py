@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from barber.sms import SMS_DISPATCH_BATCH_SIZE, SMS_DISPATCH_WORKERS, drain_outbox, get_sms_client
+
+class Command(BaseCommand):
+    help = 'Send queued SMS from the outbox, retrying failed messages with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and check the outbox every N seconds (default: run once, e.g. from cron)'
+        )
+        parser.add_argument('--batch-size', type=int, default=SMS_DISPATCH_BATCH_SIZE, help='Messages claimed per round')
+        parser.add_argument('--workers', type=int, default=SMS_DISPATCH_WORKERS, help='Messages sent at once')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            handled = drain_outbox(options['batch_size'], options['workers'])
+            if handled:
+                counts = {}
+                for entry in handled:
+                    counts[entry.status] = counts.get(entry.status, 0) + 1
+                self.stdout.write(self.style.SUCCESS(
+                    f"Sent {counts.get('sent', 0)}, retrying {counts.get('queued', 0)}, failed {counts.get('failed', 0)}"
+                ))
+                client = get_sms_client()
+                if client and client.metrics.calls:
+                    metrics = client.metrics.snapshot()
+                    self.stdout.write(
+                        f"Gateway calls: {metrics['calls']} ({metrics['failures']} failed), "
+                        f"latency p50 {metrics['p50_ms']} ms, p95 {metrics['p95_ms']} ms, max {metrics['max_ms']} ms"
+                    )
+
+            if not interval:
+                break
+            time.sleep(interval)
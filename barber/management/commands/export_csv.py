@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from barber.exports import EXPORTS, period_bounds, stream_csv
+from barber.models import Barber
+
+class Command(BaseCommand):
+    help = 'Export income or booking history as CSV for a month, a year or a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--barber', required=True, help='Username of the barber')
+        parser.add_argument('--month', help='Month to export (YYYY-MM)')
+        parser.add_argument('--year', help='Year to export (YYYY)')
+        parser.add_argument('--date-from', help='First day to export (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last day to export (YYYY-MM-DD)')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+
+    def handle(self, *args, **options):
+        try:
+            barber = Barber.objects.get(username=options['barber'])
+        except Barber.DoesNotExist:
+            raise CommandError(f"Barber '{options['barber']}' does not exist")
+
+        try:
+            date_from, date_to = period_bounds(
+                month=options['month'],
+                year=options['year'],
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+            )
+        except ValueError:
+            raise CommandError('Invalid period, use YYYY-MM, YYYY or YYYY-MM-DD dates')
+
+        header, rows = EXPORTS[options['kind']]
+        lines = stream_csv(header, rows(barber, date_from, date_to))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
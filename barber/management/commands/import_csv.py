@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from barber.imports import IMPORTS, ImportRowError
+from barber.models import Barber
+
+class Command(BaseCommand):
+    help = 'Bulk import clients or historical income for a barber from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTS), help='What the file contains')
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument('--barber', required=True, help='Username of the barber')
+
+    def handle(self, *args, **options):
+        try:
+            barber = Barber.objects.get(username=options['barber'])
+        except Barber.DoesNotExist:
+            raise CommandError(f"Barber '{options['barber']}' does not exist")
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+                result = IMPORTS[options['kind']](barber, csv_file)
+        except (OSError, ImportRowError, UnicodeDecodeError) as e:
+            raise CommandError(f"Could not import {options['path']}: {e}")
+
+        for line, message in result.errors:
+            self.stderr.write(f"Line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {options['kind']}: {result}"))
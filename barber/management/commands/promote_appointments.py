@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from barber.queue import promote_due_appointments
+
+class Command(BaseCommand):
+    help = 'Move appointments that have reached their start time into the waiting queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and promote every N seconds (default: run once, e.g. from cron)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            promoted = promote_due_appointments()
+            if promoted:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Promoted {len(promoted)} appointment(s) to the queue')
+                )
+
+            if not interval:
+                break
+            time.sleep(interval)
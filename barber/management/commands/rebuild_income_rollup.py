@@ -0,0 +1,35 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from barber.models import Barber
+from barber.rollups import rebuild_income_rollup
+
+class Command(BaseCommand):
+    help = 'Recompute the daily income rollup from income records (backfill or drift repair)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--barber', help='Only rebuild this username')
+        parser.add_argument('--date-from', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last day to rebuild (YYYY-MM-DD)')
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f"Invalid date '{value}', use YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        barber_id = None
+        if options['barber']:
+            try:
+                barber_id = Barber.objects.get(username=options['barber']).pk
+            except Barber.DoesNotExist:
+                raise CommandError(f"Barber '{options['barber']}' does not exist")
+
+        rebuilt = rebuild_income_rollup(
+            barber_id=barber_id,
+            date_from=self._parse_date(options['date_from']),
+            date_to=self._parse_date(options['date_to']),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} rollup row(s)'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from barber.models import Barber
+from barber.waittimes import rebuild_duration_stats
+
+class Command(BaseCommand):
+    help = 'Recompute service duration statistics used for queue wait estimates from completed bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--barber',
+            help='Only rebuild statistics for this username'
+        )
+
+    def handle(self, *args, **options):
+        barber = None
+        if options['barber']:
+            try:
+                barber = Barber.objects.get(username=options['barber'])
+            except Barber.DoesNotExist:
+                raise CommandError(f"Barber '{options['barber']}' does not exist")
+
+        rebuilt = rebuild_duration_stats(barber)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} duration statistic(s)'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from barber.reminders import REMINDER_HORIZON_MINUTES, REMINDER_POLL_SECONDS, ReminderScheduler
+
+class Command(BaseCommand):
+    help = 'Keep running and send each SMS reminder when it is due (replaces send_reminders from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=REMINDER_POLL_SECONDS,
+            help='Seconds between checks for new, moved or cancelled bookings'
+        )
+        parser.add_argument(
+            '--horizon',
+            type=int,
+            default=REMINDER_HORIZON_MINUTES,
+            help='Minutes of upcoming reminders kept in memory'
+        )
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(poll_seconds=options['poll'], horizon_minutes=options['horizon'])
+        self.stdout.write(self.style.SUCCESS('Reminder scheduler started'))
+        try:
+            scheduler.run(stdout=self.stdout)
+        except KeyboardInterrupt:
+            self.stdout.write('Reminder scheduler stopped')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from barber.reminders import claim_reminders, due_reminders
+from barber.sms import drain_outbox
+
+class Command(BaseCommand):
+    help = 'Send SMS reminders for appointments starting in 10 minutes (run_reminder_scheduler does this continuously)'
+
+    def handle(self, *args, **kwargs):
+        now = timezone.now()
+        # Lease and queue them all at once, then send now in gateway batches rather than one POST each
+        claim_reminders(list(due_reminders(now).values_list('pk', flat=True)), now)
+        handled = drain_outbox()
+
+        count = sum(1 for entry in handled if entry.kind == 'reminder' and entry.status == 'sent')
+        self.stdout.write(
+            self.style.SUCCESS(f'Total reminders sent: {count}')
+        )
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:47
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_appointment_interval(apps, schema_editor):
+    Booking = apps.get_model('barber', 'Booking')
+    bookings = Booking.objects.filter(
+        appointment_date__isnull=False,
+        appointment_time__isnull=False,
+    ).select_related('service')
+
+    batch = []
+    for booking in bookings.iterator(chunk_size=500):
+        duration = booking.service.duration_minutes if booking.service else 30
+        booking.appointment_start = timezone.make_aware(
+            datetime.combine(booking.appointment_date, booking.appointment_time)
+        )
+        booking.appointment_end = booking.appointment_start + timedelta(minutes=duration)
+        batch.append(booking)
+        if len(batch) >= 500:
+            Booking.objects.bulk_update(batch, ['appointment_start', 'appointment_end'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['appointment_start', 'appointment_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0006_registrationrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='appointment_end',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='appointment_start',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['barber', 'appointment_start', 'appointment_end', 'status'], name='booking_barber_interval_idx'),
+        ),
+        migrations.RunPython(backfill_appointment_interval, migrations.RunPython.noop),
+    ]
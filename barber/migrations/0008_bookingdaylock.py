@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0007_booking_appointment_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingDayLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_locks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('barber', 'date')},
+            },
+        ),
+    ]
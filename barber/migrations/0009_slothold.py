@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0008_bookingdaylock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100, unique=True)),
+                ('appointment_start', models.DateTimeField()),
+                ('appointment_end', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['barber', 'appointment_start', 'appointment_end', 'expires_at'], name='slothold_barber_interval_idx'), models.Index(fields=['barber', 'expires_at'], name='slothold_barber_expiry_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_queue_counters(apps, schema_editor):
+    """Renumber waiting queues that share positions and start each counter after them"""
+    Barber = apps.get_model('barber', 'Barber')
+    Booking = apps.get_model('barber', 'Booking')
+    QueueCounter = apps.get_model('barber', 'QueueCounter')
+
+    for barber in Barber.objects.all():
+        last_position = Booking.objects.filter(barber=barber).aggregate(
+            models.Max('queue_position')
+        )['queue_position__max'] or 0
+
+        queue = list(Booking.objects.filter(barber=barber, status='waiting').order_by('queue_position', 'added_to_queue_at'))
+        positions = [booking.queue_position for booking in queue]
+        if len(set(positions)) != len(positions):
+            for booking in queue:
+                last_position += 1
+                booking.queue_position = last_position
+            Booking.objects.bulk_update(queue, ['queue_position'])
+
+        QueueCounter.objects.create(barber=barber, last_position=last_position)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0009_slothold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueueCounter',
+            fields=[
+                ('barber', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='queue_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_position', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_queue_counters, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'waiting')), fields=('barber', 'queue_position'), name='unique_waiting_queue_position'),
+        ),
+    ]
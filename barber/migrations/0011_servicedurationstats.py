@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0010_queuecounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceDurationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+                ('recent_minutes', models.JSONField(default=list)),
+                ('median_minutes', models.FloatField(blank=True, null=True)),
+                ('p90_minutes', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duration_stats', to=settings.AUTH_USER_MODEL)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='duration_stats', to='barber.service')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('barber', 'service'), name='unique_duration_stats_service'), models.UniqueConstraint(condition=models.Q(('service__isnull', True)), fields=('barber',), name='unique_duration_stats_overall')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_income_rollup(apps, schema_editor):
+    """Build rollup rows for all existing income"""
+    Income = apps.get_model('barber', 'Income')
+    DailyIncomeRollup = apps.get_model('barber', 'DailyIncomeRollup')
+
+    unpaid_credit = models.Q(payment_method='credit', credit_paid=False)
+    rows = Income.objects.values('barber', 'date', 'service', 'payment_method').annotate(
+        row_count=models.Count('id'),
+        row_total=models.Sum('amount'),
+        row_credit_outstanding=models.Sum('amount', filter=unpaid_credit),
+        row_credit_unpaid_count=models.Count('id', filter=unpaid_credit),
+    ).order_by()
+
+    DailyIncomeRollup.objects.bulk_create([
+        DailyIncomeRollup(
+            barber_id=row['barber'],
+            date=row['date'],
+            service_id=row['service'],
+            payment_method=row['payment_method'],
+            count=row['row_count'],
+            total=row['row_total'] or 0,
+            credit_outstanding=row['row_credit_outstanding'] or 0,
+            credit_unpaid_count=row['row_credit_unpaid_count'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0011_servicedurationstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyIncomeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('eft', 'EFT'), ('credit', 'Credit'), ('other', 'Other')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit_outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit_unpaid_count', models.IntegerField(default=0)),
+                ('barber', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='income_rollups', to=settings.AUTH_USER_MODEL)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='income_rollups', to='barber.service')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('barber', 'date', 'service', 'payment_method'), name='unique_income_rollup'), models.UniqueConstraint(condition=models.Q(('service__isnull', True)), fields=('barber', 'date', 'payment_method'), name='unique_income_rollup_no_service')],
+            },
+        ),
+        migrations.RunPython(backfill_income_rollup, migrations.RunPython.noop),
+    ]
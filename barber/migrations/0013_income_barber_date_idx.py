@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0012_dailyincomerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['barber', 'date'], name='income_barber_date_idx'),
+        ),
+    ]
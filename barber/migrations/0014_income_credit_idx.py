@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0013_income_barber_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['barber', 'payment_method', 'credit_paid', 'date'], name='income_credit_idx'),
+        ),
+    ]
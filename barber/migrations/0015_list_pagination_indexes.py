@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0014_income_credit_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='income',
+            name='income_barber_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['barber', 'queue_position', 'added_to_queue_at'], name='booking_barber_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['barber', 'surname', 'name'], name='client_barber_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['barber', 'date', 'created_at'], name='income_barber_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0016_sms_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['appointment_start', 'status', 'sms_reminder_sent'], name='booking_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('barber', '0018_booking_reminder_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slothold',
+            name='client_ip',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+    ]
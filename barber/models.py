@@ -1,10 +1,10 @@
 # barber/models.py
 
-from django.db import models
+from django.db import models, connection, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
 import uuid
 
 # --- Define the Barber model FIRST ---
@@ -38,6 +38,40 @@ class Service(models.Model):
     def __str__(self):
         return f"{self.name} ({self.duration_minutes}min - R{self.price})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored duration so a change can refresh booked intervals
+        instance._loaded_duration = instance.__dict__.get('duration_minutes')
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .dashboard import invalidate_dashboard
+        loaded_duration = getattr(self, '_loaded_duration', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if loaded_duration is not None and loaded_duration != self.duration_minutes:
+                self._refresh_booking_intervals()
+        self._loaded_duration = self.duration_minutes
+        # Service names appear in the dashboard breakdowns
+        invalidate_dashboard(self.barber_id, self.income_rollups.values_list('date', flat=True).distinct())
+
+    def _refresh_booking_intervals(self):
+        """Re-derive the stored end of this service's upcoming active bookings with one UPDATE"""
+        from .availability import ACTIVE_BOOKING_STATUSES, invalidate_availability
+        upcoming = self.bookings.filter(
+            status__in=ACTIVE_BOOKING_STATUSES,
+            appointment_start__isnull=False,
+            appointment_end__gt=timezone.now(),
+        )
+        dates = list(upcoming.order_by().values_list('appointment_date', flat=True).distinct())
+        upcoming.update(appointment_end=models.ExpressionWrapper(
+            models.F('appointment_start') + timedelta(minutes=self.duration_minutes),
+            output_field=models.DateTimeField(),
+        ))
+        for date_obj in dates:
+            invalidate_availability(self.barber_id, date_obj)
+
 class Client(models.Model):
     """Client information"""
     AGE_GROUPS = [
@@ -62,6 +96,9 @@ class Client(models.Model):
     class Meta:
         ordering = ['surname', 'name']
         unique_together = ['barber', 'phone']
+        indexes = [
+            models.Index(fields=['barber', 'surname', 'name'], name='client_barber_name_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} {self.surname} - {self.phone}"
@@ -91,6 +128,9 @@ class Booking(models.Model):
     client_phone = models.CharField(max_length=15, blank=True)
     appointment_date = models.DateField(null=True, blank=True)
     appointment_time = models.TimeField(null=True, blank=True)
+    # Computed from appointment date/time and service duration on save
+    appointment_start = models.DateTimeField(null=True, blank=True, editable=False)
+    appointment_end = models.DateTimeField(null=True, blank=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='waiting')
     is_walkin = models.BooleanField(default=False)
     # Queue management
@@ -100,12 +140,36 @@ class Booking(models.Model):
     timer_ended_at = models.DateTimeField(null=True, blank=True)
     sms_confirmation_sent = models.BooleanField(default=False)
     sms_reminder_sent = models.BooleanField(default=False)
+    # Held by the reminder scheduler instance queueing this booking's reminder
+    reminder_lease_token = models.CharField(max_length=32, blank=True, editable=False)
+    reminder_lease_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
     cancellation_token = models.CharField(max_length=100, blank=True, null=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Assumed length of an appointment booked without a service
+    DEFAULT_DURATION_MINUTES = 30
+
     class Meta:
         ordering = ['queue_position', 'added_to_queue_at']
+        indexes = [
+            models.Index(
+                fields=['barber', 'appointment_start', 'appointment_end', 'status'],
+                name='booking_barber_interval_idx',
+            ),
+            models.Index(fields=['barber', 'queue_position', 'added_to_queue_at'], name='booking_barber_list_idx'),
+            # Reminder lookups by start time across all barbers
+            models.Index(fields=['appointment_start', 'status', 'sms_reminder_sent'], name='booking_reminder_due_idx'),
+            # Change polling by the reminder scheduler
+            models.Index(fields=['updated_at'], name='booking_updated_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['barber', 'queue_position'],
+                condition=models.Q(status='waiting'),
+                name='unique_waiting_queue_position',
+            ),
+        ]
 
     def __str__(self):
         client_info = self.client if self.client else self.client_name
@@ -117,15 +181,151 @@ class Booking(models.Model):
     def get_client_phone(self):
         return self.client.phone if self.client else self.client_phone
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored day so moving a booking invalidates both days
+        instance._loaded_appointment_date = instance.__dict__.get('appointment_date')
+        # Remember the stored status so queue changes can be published
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def get_duration_minutes(self):
+        return self.service.duration_minutes if self.service else self.DEFAULT_DURATION_MINUTES
+
+    def compute_appointment_interval(self):
+        """Return the aware (start, end) datetimes of the appointment, or (None, None)"""
+        if not self.appointment_date or not self.appointment_time:
+            return None, None
+        start = timezone.make_aware(datetime.combine(self.appointment_date, self.appointment_time))
+        return start, start + timedelta(minutes=self.get_duration_minutes())
+
     def save(self, *args, **kwargs):
+        self.appointment_start, self.appointment_end = self.compute_appointment_interval()
+        if 'update_fields' in kwargs and kwargs['update_fields'] is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'appointment_start', 'appointment_end'}
+
         # Auto-assign queue position if waiting
         if self.status == 'waiting' and not self.queue_position:
-            max_position = Booking.objects.filter(
-                barber=self.barber,
-                status='waiting'
-            ).aggregate(models.Max('queue_position'))['queue_position__max'] or 0
-            self.queue_position = max_position + 1
+            self.queue_position = QueueCounter.allocate(self.barber_id)
         super().save(*args, **kwargs)
+        self._invalidate_availability()
+        self._publish_queue_event()
+
+    def _publish_queue_event(self):
+        from .events import publish_queue_event, queue_event_type, serialize_booking
+        previous_status = getattr(self, '_loaded_status', None)
+        event_type = queue_event_type(previous_status, self.status)
+        self._loaded_status = self.status
+        if event_type:
+            publish_queue_event(self.barber_id, event_type, {'booking': serialize_booking(self)})
+
+    def _invalidate_availability(self):
+        from .availability import invalidate_availability
+        invalidate_availability(self.barber_id, self.appointment_date)
+        loaded_date = getattr(self, '_loaded_appointment_date', None)
+        if loaded_date != self.appointment_date:
+            invalidate_availability(self.barber_id, loaded_date)
+        self._loaded_appointment_date = self.appointment_date
+
+class BookingDayLock(models.Model):
+    """Per-barber, per-day row locked while a booking is reserved"""
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='booking_locks')
+    date = models.DateField()
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['barber', 'date']
+
+    def __str__(self):
+        return f"{self.barber} - {self.date}"
+
+class QueueCounter(models.Model):
+    """Last queue position handed out per barber, incremented atomically in the database"""
+    barber = models.OneToOneField(Barber, on_delete=models.CASCADE, primary_key=True, related_name='queue_counter')
+    last_position = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.barber} - {self.last_position}"
+
+    @classmethod
+    def _increment(cls, barber_id, count):
+        """Bump the counter and return its new value, or None if the row does not exist yet"""
+        # UPDATE ... RETURNING does the increment and the read in one round trip. SQLite only
+        # has it from 3.35, which is also when Django starts returning columns from inserts.
+        # MariaDB's INSERT ... RETURNING has no UPDATE counterpart, hence the vendor check.
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            table = connection.ops.quote_name(cls._meta.db_table)
+            column = connection.ops.quote_name('last_position')
+            barber_column = connection.ops.quote_name(cls._meta.get_field('barber').column)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET {column} = {column} + %s WHERE {barber_column} = %s RETURNING {column}",
+                    [count, barber_id],
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        if not cls.objects.filter(barber_id=barber_id).update(last_position=models.F('last_position') + count):
+            return None
+        return cls.objects.filter(barber_id=barber_id).values_list('last_position', flat=True).get()
+
+    @classmethod
+    def allocate(cls, barber_id, count=1):
+        """
+        Reserve count consecutive queue positions for the barber and return the last one.
+        The row lock taken by the increment keeps concurrent inserts from sharing a position.
+        """
+        with transaction.atomic():
+            last_position = cls._increment(barber_id, count)
+            if last_position is None:
+                # First allocation for this barber, start after any existing queue
+                start = Booking.objects.filter(barber_id=barber_id).aggregate(
+                    models.Max('queue_position')
+                )['queue_position__max'] or 0
+                cls.objects.get_or_create(barber_id=barber_id, defaults={'last_position': start})
+                last_position = cls._increment(barber_id, count)
+        return last_position
+
+class SlotHold(models.Model):
+    """Short-lived hold on a slot while a client fills in the public booking form"""
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='slot_holds')
+    token = models.CharField(max_length=100, unique=True)
+    appointment_start = models.DateTimeField()
+    appointment_end = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    # Address the hold was requested from, for the per-client hold cap
+    client_ip = models.GenericIPAddressField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barber', 'appointment_start', 'appointment_end', 'expires_at'], name='slothold_barber_interval_idx'),
+            models.Index(fields=['barber', 'expires_at'], name='slothold_barber_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.barber} - {self.appointment_start} (until {self.expires_at})"
+
+class ServiceDurationStats(models.Model):
+    """Rolling actual-duration statistics per barber and service (service empty = all services)"""
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='duration_stats')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, null=True, blank=True, related_name='duration_stats')
+    sample_count = models.PositiveIntegerField(default=0)
+    # Minutes taken by the most recent completed services, oldest first
+    recent_minutes = models.JSONField(default=list)
+    median_minutes = models.FloatField(null=True, blank=True)
+    p90_minutes = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['barber', 'service'], name='unique_duration_stats_service'),
+            models.UniqueConstraint(fields=['barber'], condition=models.Q(service__isnull=True), name='unique_duration_stats_overall'),
+        ]
+
+    def __str__(self):
+        return f"{self.barber} - {self.service or 'All services'} ({self.median_minutes} min)"
 
 class Income(models.Model):
     """Income tracking"""
@@ -153,11 +353,112 @@ class Income(models.Model):
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            models.Index(fields=['barber', 'date', 'created_at'], name='income_barber_date_idx'),
+            models.Index(fields=['barber', 'payment_method', 'credit_paid', 'date'], name='income_credit_idx'),
+        ]
 
     def __str__(self):
         client_info = self.client if self.client else self.client_name
         return f"R{self.amount} - {client_info} - {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the stored row adds to the daily rollup so edits can move it
+        instance._loaded_rollup = instance.get_rollup_contribution()
+        return instance
+
+    def get_rollup_contribution(self):
+        """Return (rollup key, amount, credit_paid) for this record, or None if fields are deferred"""
+        fields = ['barber_id', 'date', 'service_id', 'payment_method', 'amount', 'credit_paid']
+        if any(name not in self.__dict__ for name in fields):
+            return None
+        key = (
+            self.barber_id,
+            self._meta.get_field('date').to_python(self.date),
+            self.service_id,
+            self.payment_method,
+        )
+        return key, self._meta.get_field('amount').to_python(self.amount), self.credit_paid
+
+    def save(self, *args, **kwargs):
+        from .rollups import apply_income_change
+        previous = getattr(self, '_loaded_rollup', None)
+        if previous is None and not self._state.adding:
+            stored = Income.objects.filter(pk=self.pk).first()
+            previous = stored._loaded_rollup if stored else None
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            current = self.get_rollup_contribution()
+            apply_income_change(previous, current)
+        self._loaded_rollup = current
+
+class DailyIncomeRollup(models.Model):
+    """Income per barber, day, service and payment method, kept in step with Income writes"""
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='income_rollups')
+    date = models.DateField()
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, null=True, blank=True, related_name='income_rollups')
+    payment_method = models.CharField(max_length=10, choices=Income.PAYMENT_METHODS)
+    count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Unpaid credit only
+    credit_outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    credit_unpaid_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['barber', 'date', 'service', 'payment_method'], name='unique_income_rollup'),
+            models.UniqueConstraint(
+                fields=['barber', 'date', 'payment_method'],
+                condition=models.Q(service__isnull=True),
+                name='unique_income_rollup_no_service',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.barber} - {self.date} - {self.service or 'No service'} - {self.payment_method}: R{self.total}"
+
+class SmsOutbox(models.Model):
+    """SMS written in the same transaction as the change it reports, sent later by the dispatcher"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    KIND_CHOICES = [
+        ('confirmation', 'Booking confirmation'),
+        ('reminder', 'Booking reminder'),
+        ('other', 'Other'),
+    ]
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='sms_outbox')
+    booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='sms_messages')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='other')
+    phone = models.CharField(max_length=20)
+    message = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Set while a dispatcher owns the message; an expired lease means it died mid-send
+    lease_token = models.CharField(max_length=32, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='smsoutbox_due_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='smsoutbox_lease_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.phone} - {self.get_status_display()}"
+
 # --- Define RegistrationRequest AFTER all other models ---
 class RegistrationRequest(models.Model):
     """Model to store registration requests pending admin approval"""
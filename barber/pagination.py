@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Rows per page on the income, bookings and clients lists
+LIST_PAGE_SIZE = getattr(settings, 'LIST_PAGE_SIZE', 50)
+
+_CURSOR_SALT = 'barber.pagination'
+
+
+class KeysetPage:
+    """One page of rows plus opaque cursors for its neighbours"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _parse_ordering(queryset, ordering):
+    """[(field name, model field or None for pk, descending)] for an ordering like ['-date', 'pk']"""
+    parsed = []
+    for name in ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        parsed.append((name, field, descending))
+    return parsed
+
+
+def _encode_cursor(direction, row, fields):
+    values = [field.value_to_string(row) for name, field, descending in fields]
+    return signing.dumps([direction, values], salt=_CURSOR_SALT, compress=True)
+
+
+def _decode_cursor(cursor, fields):
+    """Return (direction, values) or (None, None) for a missing or tampered cursor"""
+    if not cursor:
+        return None, None
+    try:
+        direction, values = signing.loads(cursor, salt=_CURSOR_SALT)
+        if direction not in ('next', 'previous') or len(values) != len(fields):
+            return None, None
+        return direction, [field.to_python(value) for (name, field, descending), value in zip(fields, values)]
+    except (signing.BadSignature, ValidationError, ValueError, TypeError):
+        return None, None
+
+
+def _seek_filter(fields, values, backwards):
+    """
+    Rows strictly after the cursor row in the ordering, or strictly before it when going backwards:
+    (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+    """
+    condition = Q()
+    equal = {}
+    for (name, field, descending), value in zip(fields, values):
+        after = descending == backwards
+        condition |= Q(**equal, **{f"{name}__{'gt' if after else 'lt'}": value})
+        equal[name] = value
+    return condition
+
+
+def paginate(queryset, ordering, cursor=None, page_size=LIST_PAGE_SIZE):
+    """
+    Keyset pagination: each page seeks past the cursor row with an indexed
+    range filter instead of an OFFSET, so its cost does not grow with history.
+    The ordering must end in a unique column (e.g. pk) and its columns must not be NULL.
+    """
+    fields = _parse_ordering(queryset, ordering)
+    direction, values = _decode_cursor(cursor, fields)
+    backwards = direction == 'previous'
+
+    order_by = [('-' if descending != backwards else '') + name for name, field, descending in fields]
+    rows = queryset.order_by(*order_by)
+    if values is not None:
+        rows = rows.filter(_seek_filter(fields, values, backwards))
+    rows = list(rows[:page_size + 1])
+
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, values is not None
+
+    next_cursor = _encode_cursor('next', rows[-1], fields) if rows and has_next else None
+    previous_cursor = _encode_cursor('previous', rows[0], fields) if rows and has_previous else None
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def page_query(request):
+    """The request's query string without the cursor, for building page links that keep filters"""
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    return query.urlencode()
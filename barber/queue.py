@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+from .availability import invalidate_availability
+from .events import publish_queue_event
+from .models import Booking, QueueCounter
+
+# Spacing between positions after the queue is compacted, leaves room for later moves
+QUEUE_POSITION_GAP = 1024
+
+
+def get_waiting_queue(barber):
+    """Waiting bookings in queue order"""
+    return Booking.objects.filter(
+        barber=barber,
+        status='waiting'
+    ).order_by('queue_position', 'added_to_queue_at')
+
+
+def compact_queue(barber):
+    """
+    Respace every waiting position QUEUE_POSITION_GAP apart in a single bulk update.
+    The new positions come from a fresh counter range, so they never collide
+    with positions still held while the update runs.
+    """
+    with transaction.atomic():
+        queue = list(get_waiting_queue(barber).only('pk', 'queue_position'))
+        last_position = QueueCounter.allocate(barber.pk, len(queue) * QUEUE_POSITION_GAP)
+        first_position = last_position - len(queue) * QUEUE_POSITION_GAP
+        for idx, item in enumerate(queue, start=1):
+            item.queue_position = first_position + idx * QUEUE_POSITION_GAP
+        Booking.objects.bulk_update(queue, ['queue_position'])
+        publish_queue_event(barber.pk, 'reordered')
+    return queue
+
+
+def remove_from_queue(booking):
+    """
+    Take a booking out of the queue.
+    The remaining positions keep their order, so nothing else is renumbered.
+    """
+    booking.status = 'removed'
+    booking.save()
+
+
+def _place_between(booking, lower, upper):
+    """Give the booking a position strictly between lower and upper, if one exists"""
+    lower = lower or 0
+    if upper is None:
+        # The back of the queue is always a fresh position from the counter
+        booking.queue_position = QueueCounter.allocate(booking.barber_id)
+    elif upper - lower > 1:
+        booking.queue_position = (lower + upper) // 2
+    else:
+        return False
+    booking.save(update_fields=['queue_position'])
+    return True
+
+
+def move_in_queue(booking, offset):
+    """
+    Move a waiting booking offset places (negative is towards the front).
+    Only the moved row is written unless its neighbours have no gap left,
+    in which case the queue is compacted once and the move retried.
+    """
+    for attempt in range(2):
+        positions = list(get_waiting_queue(booking.barber).values_list('pk', 'queue_position'))
+        ids = [pk for pk, position in positions]
+        current = ids.index(booking.pk)
+        target = max(0, min(len(ids) - 1, current + offset))
+        if target == current:
+            return
+
+        others = [position for pk, position in positions if pk != booking.pk]
+        lower = others[target - 1] if target > 0 else None
+        upper = others[target] if target < len(others) else None
+        if _place_between(booking, lower, upper):
+            return
+        compact_queue(booking.barber)
+
+
+def promote_due_appointments(now=None, barber=None):
+    """
+    Move today's pending/confirmed appointments whose start time has passed
+    into the waiting queue with a single UPDATE. Each barber's block of
+    positions is reserved from the counter in appointment order.
+    Returns the ids of the promoted bookings.
+    """
+    now = now or timezone.now()
+    due = Booking.objects.filter(
+        status__in=['pending', 'confirmed'],
+        appointment_date=timezone.localdate(now),
+        appointment_start__lte=now
+    )
+    if barber is not None:
+        due = due.filter(barber=barber)
+
+    with transaction.atomic():
+        rows = list(due.order_by('barber_id', 'appointment_start', 'pk').values_list('pk', 'barber_id'))
+        if not rows:
+            return []
+
+        ids_by_barber = {}
+        for pk, barber_id in rows:
+            ids_by_barber.setdefault(barber_id, []).append(pk)
+
+        whens = []
+        for barber_id, ids in ids_by_barber.items():
+            last_position = QueueCounter.allocate(barber_id, len(ids))
+            first_position = last_position - len(ids) + 1
+            whens += [When(pk=pk, then=Value(first_position + idx)) for idx, pk in enumerate(ids)]
+
+        ids = [pk for pk, barber_id in rows]
+        Booking.objects.filter(pk__in=ids, status__in=['pending', 'confirmed']).update(
+            status='waiting',
+            queue_position=Case(*whens, output_field=IntegerField()),
+        )
+
+    # The update bypasses Booking.save, so refresh availability and notify here
+    for barber_id, promoted_ids in ids_by_barber.items():
+        invalidate_availability(barber_id, timezone.localdate(now))
+        publish_queue_event(barber_id, 'promoted', {'bookings': promoted_ids})
+    return ids
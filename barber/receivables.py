@@ -0,0 +1,75 @@
+from datetime import timedelta
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Q, Sum, Value, When, Window
+from .models import Income
+
+UNPAID = Q(credit_paid=False)
+
+
+def _credit_rows(barber, month_start):
+    """Unpaid credit from any month plus this month's paid credit"""
+    return Income.objects.filter(
+        Q(credit_paid=False) | Q(date__gte=month_start),
+        barber=barber,
+        payment_method='credit',
+    )
+
+
+def get_receivables(barber, today):
+    """
+    Outstanding credit per client with aging buckets (0-30, 31-60, 61+ days),
+    overall totals and this month's paid count, from one grouped query.
+    """
+    month_start = today.replace(day=1)
+    days_30 = today - timedelta(days=30)
+    days_60 = today - timedelta(days=60)
+
+    rows = _credit_rows(barber, month_start).values(
+        'client', 'client__name', 'client__surname', 'client__phone'
+    ).annotate(
+        total_owed=Sum('amount', filter=UNPAID),
+        unpaid_count=Count('id', filter=UNPAID),
+        paid_count=Count('id', filter=Q(credit_paid=True)),
+        owed_0_30=Sum('amount', filter=UNPAID & Q(date__gte=days_30)),
+        owed_31_60=Sum('amount', filter=UNPAID & Q(date__lt=days_30, date__gte=days_60)),
+        owed_61_plus=Sum('amount', filter=UNPAID & Q(date__lt=days_60)),
+        oldest_unpaid=Min('date', filter=UNPAID),
+        last_credit=Max('date'),
+    ).order_by()
+
+    totals = {
+        'total_credit': 0,
+        'unpaid_count': 0,
+        'paid_count': 0,
+        'owed_0_30': 0,
+        'owed_31_60': 0,
+        'owed_61_plus': 0,
+    }
+    summary = []
+    for row in rows:
+        for name in totals:
+            value = row['total_owed' if name == 'total_credit' else name] or 0
+            totals[name] += value
+        if row['unpaid_count']:
+            summary.append(row)
+    summary.sort(key=lambda row: row['total_owed'], reverse=True)
+    return summary, totals
+
+
+def get_credit_ledger(barber, today):
+    """
+    Credit transactions, each annotated with the client's unpaid balance up to
+    and including it. The balance is computed in the database with a window function.
+    """
+    month_start = today.replace(day=1)
+    unpaid_amount = Case(
+        When(credit_paid=False, then=F('amount')),
+        default=Value(0),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    return _credit_rows(barber, month_start).annotate(
+        running_balance=Window(
+            expression=Sum(unpaid_amount),
+            partition_by=[F('client')],
+            order_by=[F('date').asc(), F('created_at').asc(), F('id').asc()],
+        )
+    ).select_related('client', 'service').order_by('credit_paid', '-date', '-created_at')
@@ -0,0 +1,188 @@
+import heapq
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from .models import Booking
+from .sms import REMINDER_LEAD_MINUTES, REMINDER_WINDOW_MINUTES, drain_outbox, queue_booking_reminders
+
+# Seconds the scheduler sleeps at most before checking for booking changes
+REMINDER_POLL_SECONDS = getattr(settings, 'REMINDER_POLL_SECONDS', 5)
+
+# How far ahead reminders are loaded into memory, and how often that load is redone
+REMINDER_HORIZON_MINUTES = getattr(settings, 'REMINDER_HORIZON_MINUTES', 60)
+REMINDER_RELOAD_SECONDS = getattr(settings, 'REMINDER_RELOAD_SECONDS', 5 * 60)
+
+# Seconds a scheduler instance holds a booking while queueing its reminder
+REMINDER_LEASE_SECONDS = getattr(settings, 'REMINDER_LEASE_SECONDS', 60)
+
+# Change polls look this far behind the newest updated_at seen, for transactions that committed late
+REMINDER_CHANGE_OVERLAP_SECONDS = 30
+
+
+def _lead():
+    return timedelta(minutes=REMINDER_LEAD_MINUTES)
+
+
+def _latest_start(now):
+    """Appointments starting sooner than this are too close for a reminder"""
+    return now + _lead() - timedelta(minutes=REMINDER_WINDOW_MINUTES)
+
+
+def reminder_candidates():
+    """Bookings still owed a reminder: not reminded or queued for it, with the barber's SMS notifications on"""
+    return Booking.objects.filter(
+        status__in=['pending', 'confirmed'],
+        sms_reminder_sent=False,
+        barber__sms_notifications_enabled=True,
+    ).exclude(
+        sms_messages__kind='reminder'
+    )
+
+
+def due_reminders(now=None):
+    """
+    Bookings that need a reminder now: starting about REMINDER_LEAD_MINUTES from now.
+    The range on appointment_start is served by booking_reminder_due_idx.
+    """
+    now = now or timezone.now()
+    window = timedelta(minutes=REMINDER_WINDOW_MINUTES)
+    return reminder_candidates().filter(
+        appointment_start__gte=now + _lead() - window,
+        appointment_start__lte=now + _lead() + window,
+    ).select_related('barber', 'client').order_by()
+
+
+def claim_reminders(booking_ids, now=None):
+    """
+    Lease the bookings to this process and queue their reminders in one
+    transaction. The leasing UPDATE re-checks each row, so a booking another
+    instance is already queueing is skipped and every reminder is queued once.
+    Returns the queued outbox rows.
+    """
+    now = now or timezone.now()
+    token = uuid.uuid4().hex
+    with transaction.atomic():
+        reminder_candidates().filter(
+            Q(reminder_lease_expires_at__isnull=True) | Q(reminder_lease_expires_at__lte=now),
+            pk__in=booking_ids,
+            appointment_start__gte=_latest_start(now),
+        ).update(
+            reminder_lease_token=token,
+            reminder_lease_expires_at=now + timedelta(seconds=REMINDER_LEASE_SECONDS),
+        )
+        bookings = Booking.objects.filter(reminder_lease_token=token).select_related('barber', 'client')
+        return queue_booking_reminders(bookings, wake=False)
+
+
+class ReminderScheduler:
+    """
+    Keeps upcoming reminder times in a min-heap and queues each reminder when
+    its time comes. Bookings are loaded for the next REMINDER_HORIZON_MINUTES;
+    after that only rows whose updated_at moved are read, so new, moved and
+    cancelled bookings are picked up within REMINDER_POLL_SECONDS.
+    """
+
+    def __init__(self, poll_seconds=REMINDER_POLL_SECONDS, horizon_minutes=REMINDER_HORIZON_MINUTES,
+                 reload_seconds=REMINDER_RELOAD_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.horizon = timedelta(minutes=horizon_minutes)
+        self.reload_interval = timedelta(seconds=reload_seconds)
+        self._heap = []
+        # Booking pk -> reminder time of its live heap entry; other heap entries for it are stale
+        self._scheduled = {}
+        self._loaded_at = None
+        self._changes_since = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def _schedule(self, pk, appointment_start, now):
+        remind_at = appointment_start - _lead()
+        if appointment_start < _latest_start(now) or remind_at > now + self.horizon:
+            self._scheduled.pop(pk, None)
+        elif self._scheduled.get(pk) != remind_at:
+            self._scheduled[pk] = remind_at
+            heapq.heappush(self._heap, (remind_at, pk))
+
+    def load(self, now):
+        """Schedule every booking whose reminder falls within the horizon"""
+        rows = reminder_candidates().filter(
+            appointment_start__gte=_latest_start(now),
+            appointment_start__lte=now + self.horizon + _lead(),
+        ).values_list('pk', 'appointment_start')
+
+        self._heap = []
+        self._scheduled = {}
+        for pk, appointment_start in rows:
+            self._schedule(pk, appointment_start, now)
+        self._loaded_at = now
+        if self._changes_since is None:
+            self._changes_since = now
+
+    def poll_changes(self, now):
+        """Reschedule or drop bookings saved since the last poll"""
+        since = self._changes_since - timedelta(seconds=REMINDER_CHANGE_OVERLAP_SECONDS)
+        changed = Booking.objects.filter(updated_at__gt=since).order_by()
+        latest = changed.aggregate(latest=Max('updated_at'))['latest']
+        if latest is None:
+            return
+
+        eligible = dict(
+            reminder_candidates().filter(pk__in=changed.values('pk'), appointment_start__isnull=False)
+            .values_list('pk', 'appointment_start')
+        )
+        for pk in changed.values_list('pk', flat=True):
+            if pk in eligible:
+                self._schedule(pk, eligible[pk], now)
+            else:
+                self._scheduled.pop(pk, None)
+        self._changes_since = max(self._changes_since, latest)
+
+    def pop_due(self, now):
+        """Booking pks whose reminder time has come"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            remind_at, pk = heapq.heappop(self._heap)
+            if self._scheduled.get(pk) == remind_at:
+                del self._scheduled[pk]
+                due.append(pk)
+        return due
+
+    def seconds_until_next(self, now):
+        """Sleep until the next reminder is due, but no longer than the poll interval"""
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        wait = self.poll_seconds
+        if self._heap:
+            wait = min(wait, (self._heap[0][0] - now).total_seconds())
+        return max(wait, 0)
+
+    def run_once(self, now=None):
+        """One scheduler tick: refresh the heap, then queue every reminder that is due. Returns the queued rows."""
+        now = now or timezone.now()
+        if self._loaded_at is None or now - self._loaded_at >= self.reload_interval:
+            self.load(now)
+        else:
+            self.poll_changes(now)
+
+        due = self.pop_due(now)
+        return claim_reminders(due, now) if due else []
+
+    def run(self, stdout=None):
+        """Run until interrupted, sending reminders as soon as they are queued"""
+        while True:
+            try:
+                queued = self.run_once()
+                if queued:
+                    drain_outbox()
+                    if stdout:
+                        stdout.write(f"Queued {len(queued)} reminder(s)")
+            except Exception as e:
+                print(f"Reminder scheduler error: {e}")
+            finally:
+                close_old_connections()
+            time.sleep(self.seconds_until_next(timezone.now()))
@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from .dashboard import invalidate_dashboard
+from .models import DailyIncomeRollup, Income
+
+ROLLUP_FIELDS = ['count', 'total', 'credit_outstanding', 'credit_unpaid_count']
+
+UNPAID_CREDIT = Q(payment_method='credit', credit_paid=False)
+
+
+def _deltas(contribution, sign):
+    """Rollup field changes for adding (sign=1) or removing (sign=-1) one income record"""
+    key, amount, credit_paid = contribution
+    unpaid = key[3] == 'credit' and not credit_paid
+    return key, {
+        'count': sign,
+        'total': sign * amount,
+        'credit_outstanding': sign * amount if unpaid else 0,
+        'credit_unpaid_count': sign if unpaid else 0,
+    }
+
+
+def _apply_deltas(key, deltas):
+    barber_id, date, service_id, payment_method = key
+    lookup = {'barber_id': barber_id, 'date': date, 'service_id': service_id, 'payment_method': payment_method}
+    updates = {name: F(name) + value for name, value in deltas.items()}
+    if DailyIncomeRollup.objects.filter(**lookup).update(**updates):
+        return
+    rollup, created = DailyIncomeRollup.objects.get_or_create(**lookup)
+    DailyIncomeRollup.objects.filter(pk=rollup.pk).update(**updates)
+
+
+def apply_income_change(previous, current):
+    """
+    Move an income record's contribution from its previous rollup row to its current one.
+    Either side may be None for creates and deletes. Each touched row gets one F() update,
+    and the cached dashboards for the affected days are invalidated.
+    """
+    changes = {}
+    for contribution, sign in ((previous, -1), (current, 1)):
+        if contribution is None:
+            continue
+        key, deltas = _deltas(contribution, sign)
+        merged = changes.setdefault(key, dict.fromkeys(ROLLUP_FIELDS, 0))
+        for name, value in deltas.items():
+            merged[name] += value
+
+    dates_by_barber = {}
+    for key, deltas in changes.items():
+        if any(deltas.values()):
+            _apply_deltas(key, deltas)
+            dates_by_barber.setdefault(key[0], set()).add(key[1])
+    for barber_id, dates in dates_by_barber.items():
+        invalidate_dashboard(barber_id, dates)
+
+
+def rebuild_income_rollup(barber_id=None, date_from=None, date_to=None, dates=None):
+    """
+    Recompute rollup rows from Income, for backfill and drift repair.
+    Only rows matching the filters are replaced. Returns the number of rows written.
+    """
+    filters = {}
+    if barber_id is not None:
+        filters['barber_id'] = barber_id
+    if date_from:
+        filters['date__gte'] = date_from
+    if date_to:
+        filters['date__lte'] = date_to
+    if dates is not None:
+        filters['date__in'] = dates
+
+    rows = Income.objects.filter(**filters).values('barber', 'date', 'service', 'payment_method').annotate(
+        row_count=Count('id'),
+        row_total=Sum('amount'),
+        row_credit_outstanding=Sum('amount', filter=UNPAID_CREDIT),
+        row_credit_unpaid_count=Count('id', filter=UNPAID_CREDIT),
+    ).order_by()
+
+    with transaction.atomic():
+        rollups = [
+            DailyIncomeRollup(
+                barber_id=row['barber'],
+                date=row['date'],
+                service_id=row['service'],
+                payment_method=row['payment_method'],
+                count=row['row_count'],
+                total=row['row_total'] or 0,
+                credit_outstanding=row['row_credit_outstanding'] or 0,
+                credit_unpaid_count=row['row_credit_unpaid_count'],
+            )
+            for row in rows
+        ]
+        stale = DailyIncomeRollup.objects.filter(**filters)
+        touched = set(stale.values_list('barber_id', 'date').distinct())
+        touched.update((rollup.barber_id, rollup.date) for rollup in rollups)
+        stale.delete()
+        DailyIncomeRollup.objects.bulk_create(rollups, batch_size=1000)
+
+    dates_by_barber = {}
+    for barber_id, date in touched:
+        dates_by_barber.setdefault(barber_id, set()).add(date)
+    for barber_id, dates in dates_by_barber.items():
+        invalidate_dashboard(barber_id, dates)
+    return len(rollups)
@@ -0,0 +1,50 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Barber, Booking, Income, Service
+
+# Deletes are handled here rather than in Model.delete() so queryset deletes,
+# including the admin's "delete selected" action, keep derived data in step.
+
+
+def _deleted_with_barber(origin):
+    """Whether the delete started from a barber, whose rollups and caches go with it"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, Barber)
+
+
+@receiver(post_delete, sender=Income)
+def remove_income_from_rollup(sender, instance, origin=None, **kwargs):
+    from .rollups import apply_income_change
+    if _deleted_with_barber(origin):
+        return
+    previous = getattr(instance, '_loaded_rollup', None) or instance.get_rollup_contribution()
+    apply_income_change(previous, None)
+    instance._loaded_rollup = None
+
+
+@receiver(pre_delete, sender=Service)
+def note_service_income_dates(sender, instance, origin=None, **kwargs):
+    # Read before the cascade removes the service's rollup rows
+    if not _deleted_with_barber(origin):
+        instance._income_dates = list(instance.income_rollups.values_list('date', flat=True).distinct())
+
+
+@receiver(post_delete, sender=Service)
+def refile_service_income(sender, instance, **kwargs):
+    """Income rows keep their amounts with the service cleared, so rebuild those days"""
+    from .rollups import rebuild_income_rollup
+    dates = getattr(instance, '_income_dates', None)
+    if dates:
+        rebuild_income_rollup(barber_id=instance.barber_id, dates=dates)
+
+
+@receiver(post_delete, sender=Booking)
+def release_booked_slot(sender, instance, origin=None, **kwargs):
+    from .events import publish_queue_event, queue_event_type, serialize_booking
+    if _deleted_with_barber(origin):
+        return
+    instance._invalidate_availability()
+    # A deleted queue entry leaves the queue just like a removed one
+    if queue_event_type(instance.status, 'removed'):
+        publish_queue_event(instance.barber_id, 'removed', {'booking': serialize_booking(instance)})
@@ -1,69 +1,467 @@
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from .models import Booking, SmsOutbox
+from .waittimes import percentile
 
-def send_sms(phone, message):
+# Seconds to wait for a connection to the SMS gateway, and then for its response
+SMS_CONNECT_TIMEOUT = getattr(settings, 'SMS_CONNECT_TIMEOUT', 5)
+SMS_READ_TIMEOUT = getattr(settings, 'SMS_READ_TIMEOUT', 15)
+
+# Quick retries inside one send on connection errors, 429 and 5xx, before the outbox backoff takes over
+SMS_HTTP_RETRIES = getattr(settings, 'SMS_HTTP_RETRIES', 2)
+SMS_HTTP_BACKOFF_FACTOR = getattr(settings, 'SMS_HTTP_BACKOFF_FACTOR', 0.5)
+
+# Longest Retry-After from the gateway that is waited out in place
+SMS_RETRY_AFTER_MAX_SECONDS = getattr(settings, 'SMS_RETRY_AFTER_MAX_SECONDS', 10)
+
+# Gateway calls kept for the latency percentiles
+SMS_METRICS_WINDOW = 500
+
+# Attempts before an outbox message is marked failed
+SMS_MAX_ATTEMPTS = getattr(settings, 'SMS_MAX_ATTEMPTS', 5)
+
+# Delay before the first retry, doubled after every failed attempt up to SMS_RETRY_MAX_SECONDS
+SMS_RETRY_BASE_SECONDS = getattr(settings, 'SMS_RETRY_BASE_SECONDS', 30)
+SMS_RETRY_MAX_SECONDS = getattr(settings, 'SMS_RETRY_MAX_SECONDS', 60 * 60)
+
+# Seconds a dispatcher owns a claimed message; once expired another dispatcher picks it up again
+SMS_LEASE_SECONDS = getattr(settings, 'SMS_LEASE_SECONDS', 120)
+
+# Messages submitted to the gateway in one POST
+SMS_GATEWAY_BATCH_SIZE = getattr(settings, 'SMS_GATEWAY_BATCH_SIZE', 100)
+
+# Messages claimed per round, and how many gateway batches are sent at once (also the size of the connection pool)
+SMS_DISPATCH_BATCH_SIZE = getattr(settings, 'SMS_DISPATCH_BATCH_SIZE', 500)
+SMS_DISPATCH_WORKERS = getattr(settings, 'SMS_DISPATCH_WORKERS', 4)
+
+# Seconds between outbox polls when nothing wakes the dispatcher
+SMS_POLL_INTERVAL = getattr(settings, 'SMS_POLL_INTERVAL', 15)
+
+# Drain the outbox from a thread in the web process; turn off when `manage.py dispatch_sms` runs instead
+SMS_DISPATCH_IN_PROCESS = getattr(settings, 'SMS_DISPATCH_IN_PROCESS', True)
+
+# Public address of the site, used for links in messages
+SITE_URL = getattr(settings, 'SITE_URL', '')
+
+# Reminders go out for appointments starting this many minutes from now, give or take the window
+# (so a cron run every minute or two still catches each booking)
+REMINDER_LEAD_MINUTES = getattr(settings, 'REMINDER_LEAD_MINUTES', 10)
+REMINDER_WINDOW_MINUTES = 1
+
+# Booking flag set once a message of each kind has been delivered
+SENT_FLAGS = {
+    'confirmation': 'sms_confirmation_sent',
+    'reminder': 'sms_reminder_sent',
+}
+
+
+class SmsDeliveryError(Exception):
+    """Raised when the gateway did not accept a message"""
+
+
+def format_phone(phone):
+    """Put a local number in international format"""
+    if not phone.startswith('+'):
+        phone = '+27' + phone.lstrip('0')
+    return phone
+
+
+class SmsMetrics:
+    """Outcome and latency of recent gateway calls, updated from the dispatcher threads"""
+
+    def __init__(self, window=SMS_METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            self._latencies.append(seconds)
+
+    def snapshot(self):
+        """Call counts plus p50/p95/max latency in milliseconds over the recent window"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls, failures = self.calls, self.failures
+        return {
+            'calls': calls,
+            'failures': failures,
+            'p50_ms': _milliseconds(percentile(latencies, 50)),
+            'p95_ms': _milliseconds(percentile(latencies, 95)),
+            'max_ms': _milliseconds(latencies[-1] if latencies else None),
+        }
+
+
+def _milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class _CappedRetry(Retry):
+    """Honours Retry-After, but never sleeps longer than SMS_RETRY_AFTER_MAX_SECONDS"""
+
+    def get_retry_after(self, response):
+        seconds = super().get_retry_after(response)
+        return None if seconds is None else min(seconds, SMS_RETRY_AFTER_MAX_SECONDS)
+
+
+class BulkSMSClient:
     """
-    Send SMS using BulkSMS South Africa
+    BulkSMS South Africa API client. One keep-alive session with a small
+    connection pool is shared by the dispatcher threads, so a burst of
+    messages reuses a few TLS connections instead of opening one per SMS.
     You need to sign up at https://www.bulksms.com/za/ and get API credentials
     """
-    
-    # BulkSMS API configuration
-    BULKSMS_USERNAME = getattr(settings, 'BULKSMS_USERNAME', '')
-    BULKSMS_PASSWORD = getattr(settings, 'BULKSMS_PASSWORD', '')
-    
-    if not BULKSMS_USERNAME or not BULKSMS_PASSWORD:
+    API_URL = 'https://api.bulksms.com/v1/messages'
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, username, password, connect_timeout=SMS_CONNECT_TIMEOUT, read_timeout=SMS_READ_TIMEOUT,
+                 retries=SMS_HTTP_RETRIES, pool_size=SMS_DISPATCH_WORKERS, url=API_URL):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.metrics = SmsMetrics()
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        # read=0: once the request went out, a lost response is left to the outbox rather than resent at once
+        retry = _CappedRetry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=SMS_HTTP_BACKOFF_FACTOR,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({'POST'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def post(self, payload):
+        """POST to the messages endpoint, raising SmsDeliveryError unless the gateway answers 201"""
+        started = time.monotonic()
+        ok = False
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            ok = response.status_code == 201
+        except requests.RequestException as e:
+            raise SmsDeliveryError(str(e))
+        finally:
+            self.metrics.record(time.monotonic() - started, ok)
+        if not ok:
+            raise SmsDeliveryError(f"{response.status_code}: {response.text[:500]}")
+        return response
+
+    def send(self, phone, message):
+        self.post({'to': format_phone(phone), 'body': message})
+
+    def send_batch(self, messages):
+        """
+        Submit (phone, message) pairs in one POST. Returns one item per message,
+        in order: None if the gateway accepted it, otherwise the error.
+        """
+        try:
+            response = self.post([{'to': format_phone(phone), 'body': body} for phone, body in messages])
+        except SmsDeliveryError as e:
+            return [str(e)] * len(messages)
+
+        try:
+            results = response.json()
+        except ValueError:
+            results = None
+        if not isinstance(results, list):
+            # Accepted as a whole without per-message detail
+            return [None] * len(messages)
+
+        errors = []
+        for index in range(len(messages)):
+            result = results[index] if index < len(results) else None
+            status = result.get('status') if isinstance(result, dict) else None
+            if isinstance(status, dict) and status.get('type') == 'FAILED':
+                errors.append(f"Rejected by gateway: {status.get('subtype') or 'FAILED'}")
+            else:
+                errors.append(None)
+        return errors
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_sms_client():
+    """The process-wide BulkSMS client, or None when no credentials are configured"""
+    global _client
+    username = getattr(settings, 'BULKSMS_USERNAME', '')
+    password = getattr(settings, 'BULKSMS_PASSWORD', '')
+    if not username or not password:
+        return None
+    with _client_lock:
+        if _client is None or _client.session.auth != (username, password):
+            _client = BulkSMSClient(username, password)
+        return _client
+
+
+def deliver_sms(phone, message):
+    """Send one SMS through the shared client, raising SmsDeliveryError if it was not accepted"""
+    client = get_sms_client()
+    if client is None:
         print(f"SMS not configured. Would send to {phone}: {message}")
-        return False
-    
+        raise SmsDeliveryError("SMS not configured")
+    client.send(phone, message)
+
+
+def deliver_batch(messages):
+    """Send (phone, message) pairs in one gateway call; returns None or an error per message"""
+    client = get_sms_client()
+    if client is None:
+        for phone, message in messages:
+            print(f"SMS not configured. Would send to {phone}: {message}")
+        return ["SMS not configured"] * len(messages)
+    return client.send_batch(messages)
+
+
+def send_sms(phone, message):
+    """Send an SMS straight away, returning whether the gateway accepted it"""
     try:
-        url = 'https://api.bulksms.com/v1/messages'
-        auth = (BULKSMS_USERNAME, BULKSMS_PASSWORD)
-        
-        # Ensure phone number is in international format
-        if not phone.startswith('+'):
-            phone = '+27' + phone.lstrip('0')
-        
-        data = {
-            'to': phone,
-            'body': message,
-        }
-        
-        response = requests.post(url, json=data, auth=auth)
-        
-        if response.status_code == 201:
-            return True
-        else:
-            print(f"SMS failed: {response.text}")
-            return False
-    
-    except Exception as e:
-        print(f"SMS error: {str(e)}")
+        deliver_sms(phone, message)
+    except SmsDeliveryError as e:
+        print(f"SMS failed: {e}")
         return False
+    return True
 
 
-def send_booking_confirmation(booking):
-    """Send booking confirmation SMS"""
-    phone = booking.get_client_phone()
+def queue_sms(barber, phone, message, booking=None, kind='other', wake=True):
+    """
+    Add a message to the outbox. Call it inside the transaction that makes the
+    change being reported, so the message exists exactly when the change does.
+    The dispatcher is woken once the transaction commits.
+    """
+    entry = SmsOutbox.objects.create(barber=barber, booking=booking, kind=kind, phone=phone, message=message)
+    if wake:
+        transaction.on_commit(wake_dispatcher)
+    return entry
+
+
+def confirmation_message(booking):
     name = booking.get_client_name()
-    
-    message = f"Hi {name}, your appointment with {booking.barber.username} is confirmed for {booking.appointment_date} at {booking.appointment_time.strftime('%H:%M')}. To cancel: {settings.SITE_URL}/cancel/{booking.cancellation_token}"
-    
-    if send_sms(phone, message):
-        booking.sms_confirmation_sent = True
-        booking.save()
-        return True
-    return False
-
-
-def send_booking_reminder(booking):
-    """Send 10-minute reminder SMS"""
-    phone = booking.get_client_phone()
+    return f"Hi {name}, your appointment with {booking.barber.username} is confirmed for {booking.appointment_date} at {booking.appointment_time.strftime('%H:%M')}. To cancel: {SITE_URL}/cancel/{booking.cancellation_token}"
+
+
+def queue_booking_confirmation(booking):
+    """Queue the booking confirmation SMS"""
+    return queue_sms(
+        booking.barber, booking.get_client_phone(), confirmation_message(booking),
+        booking=booking, kind='confirmation',
+    )
+
+
+def reminder_message(booking):
     name = booking.get_client_name()
-    
-    message = f"Hi {name}, your appointment with {booking.barber.username} starts in 10 minutes at {booking.appointment_time.strftime('%H:%M')}. See you soon!"
-    
-    if send_sms(phone, message):
-        booking.sms_reminder_sent = True
-        booking.save()
-        return True
-    return False
\ No newline at end of file
+    return f"Hi {name}, your appointment with {booking.barber.username} starts in {REMINDER_LEAD_MINUTES} minutes at {booking.appointment_time.strftime('%H:%M')}. See you soon!"
+
+
+def queue_booking_reminders(bookings, wake=True):
+    """Queue 10-minute reminder SMS for the bookings with one INSERT"""
+    entries = SmsOutbox.objects.bulk_create([
+        SmsOutbox(
+            barber=booking.barber, booking=booking, kind='reminder',
+            phone=booking.get_client_phone(), message=reminder_message(booking),
+        )
+        for booking in bookings
+    ])
+    if entries and wake:
+        transaction.on_commit(wake_dispatcher)
+    return entries
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts"""
+    return min(SMS_RETRY_BASE_SECONDS * 2 ** (attempts - 1), SMS_RETRY_MAX_SECONDS)
+
+
+def _due(now):
+    """Queued messages whose time has come, and claimed ones whose dispatcher let the lease run out"""
+    return Q(status='queued', next_attempt_at__lte=now) | Q(status='sending', lease_expires_at__lte=now)
+
+
+def claim_messages(limit=SMS_DISPATCH_BATCH_SIZE, now=None):
+    """
+    Lease up to limit due messages to this dispatcher. The claiming UPDATE
+    re-checks that each row is still due, so two dispatchers never own the
+    same message at once.
+    """
+    now = now or timezone.now()
+    ids = list(
+        SmsOutbox.objects.filter(_due(now)).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    SmsOutbox.objects.filter(_due(now), pk__in=ids).update(
+        status='sending',
+        lease_token=token,
+        lease_expires_at=now + timedelta(seconds=SMS_LEASE_SECONDS),
+        attempts=F('attempts') + 1,
+    )
+    return list(SmsOutbox.objects.filter(lease_token=token).order_by('next_attempt_at', 'pk'))
+
+
+def _attempt(entries):
+    """Send one gateway batch; returns None or the error per message. Runs on a worker thread, no database access."""
+    try:
+        return deliver_batch([(entry.phone, entry.message) for entry in entries])
+    except Exception as e:
+        return [f"{type(e).__name__}: {e}"] * len(entries)
+
+
+def _mark_bookings_sent(entries):
+    """Set each booking's sms_*_sent flag for its delivered messages, in one UPDATE"""
+    booking_ids = {flag: [] for flag in SENT_FLAGS.values()}
+    for entry in entries:
+        flag = SENT_FLAGS.get(entry.kind)
+        if flag and entry.booking_id:
+            booking_ids[flag].append(entry.booking_id)
+
+    updates = {
+        flag: Case(When(pk__in=ids, then=Value(True)), default=F(flag))
+        for flag, ids in booking_ids.items() if ids
+    }
+    if updates:
+        Booking.objects.filter(pk__in=[pk for ids in booking_ids.values() for pk in ids]).update(**updates)
+
+
+def _finish(entries, errors, now):
+    """
+    Record the outcome of a claimed batch with a few UPDATEs. Messages whose
+    lease was lost to another dispatcher meanwhile are left alone.
+    """
+    with transaction.atomic():
+        owned = set(
+            SmsOutbox.objects.select_for_update()
+            .filter(pk__in=[entry.pk for entry in entries], lease_token=entries[0].lease_token)
+            .order_by()
+            .values_list('pk', flat=True)
+        )
+        released = {'lease_token': '', 'lease_expires_at': None}
+
+        sent = [entry for entry, error in zip(entries, errors) if error is None and entry.pk in owned]
+        if sent:
+            SmsOutbox.objects.filter(pk__in=[entry.pk for entry in sent]).update(
+                status='sent', sent_at=now, last_error='', **released
+            )
+            _mark_bookings_sent(sent)
+        for entry in sent:
+            entry.status = 'sent'
+            entry.sent_at = now
+
+        failed = {}
+        for entry, error in zip(entries, errors):
+            if error is None or entry.pk not in owned:
+                continue
+            if entry.attempts >= SMS_MAX_ATTEMPTS:
+                entry.status = 'failed'
+            else:
+                entry.status = 'queued'
+                entry.next_attempt_at = now + timedelta(seconds=retry_delay(entry.attempts))
+            entry.last_error = error
+            print(f"SMS to {entry.phone} failed (attempt {entry.attempts}, {entry.status}): {error}")
+            failed.setdefault((entry.status, entry.next_attempt_at, error), []).append(entry.pk)
+        for (status, next_attempt_at, error), ids in failed.items():
+            SmsOutbox.objects.filter(pk__in=ids).update(
+                status=status, next_attempt_at=next_attempt_at, last_error=error, **released
+            )
+
+
+def dispatch_pending(limit=SMS_DISPATCH_BATCH_SIZE, workers=SMS_DISPATCH_WORKERS, batch_size=SMS_GATEWAY_BATCH_SIZE):
+    """
+    Claim due messages, submit them to the gateway in batches of batch_size
+    (several batches at once) and record every outcome. Failures are retried
+    with exponential backoff until SMS_MAX_ATTEMPTS.
+    Returns the claimed messages with their new status.
+    """
+    entries = claim_messages(limit)
+    if not entries:
+        return []
+
+    batches = [entries[start:start + batch_size] for start in range(0, len(entries), batch_size)]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as pool:
+        errors = [error for batch_errors in pool.map(_attempt, batches) for error in batch_errors]
+
+    _finish(entries, errors, timezone.now())
+    return entries
+
+
+def drain_outbox(limit=SMS_DISPATCH_BATCH_SIZE, workers=SMS_DISPATCH_WORKERS):
+    """Dispatch batches until no message is due; returns every message handled"""
+    handled = []
+    while True:
+        entries = dispatch_pending(limit, workers)
+        handled += entries
+        if len(entries) < limit:
+            return handled
+
+
+class SmsDispatcher:
+    """Daemon thread that drains the outbox when woken, and every poll_interval seconds for retries"""
+
+    def __init__(self, poll_interval=SMS_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run, name='sms-dispatcher', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                drain_outbox()
+            except Exception as e:
+                print(f"SMS dispatcher error: {e}")
+            finally:
+                close_old_connections()
+            self._wake.wait(self.poll_interval)
+
+
+_dispatcher = SmsDispatcher()
+
+
+def wake_dispatcher():
+    """Have the in-process dispatcher look at the outbox now"""
+    if SMS_DISPATCH_IN_PROCESS:
+        _dispatcher.wake()
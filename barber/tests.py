@@ -8,6 +8,7 @@ from django.urls import reverse
 from django.utils import timezone
 from datetime import date, time, datetime, timedelta
 from django.core.exceptions import ValidationError
+from unittest import mock
 from barber.models import Barber, Service, Client, Booking, Income
 from barber.forms import (
     BarberRegistrationForm, ServiceForm, ClientForm, BookingForm,
@@ -578,4 +579,1773 @@ class TestViews(TestCase):
     # Add more tests for other views as needed (e.g., delete, edit, detail views)
     # Remember to handle authentication for views that require it.
     # Remember to handle POST data correctly for views that process forms.
-    # Consider mocking external services (like SMS) if they are called during view processing.
\ No newline at end of file
+    # Consider mocking external services (like SMS) if they are called during view processing.
+# ==================== AVAILABILITY TESTS ====================
+
+from django.core.cache import cache
+from barber.availability import (
+    compute_free_slots, get_available_slots, get_available_days, get_availability_cache_stats,
+    reserve_booking, hold_slot, SlotUnavailable, BOOKING_WINDOW_DAYS
+)
+from barber.models import SlotHold
+
+
+class TestAvailability(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(
+            username='slot_barber', password='testpass123',
+            work_start_time=time(9, 0), work_end_time=time(11, 0)
+        )
+        self.service = Service.objects.create(
+            barber=self.barber, name='Haircut', duration_minutes=40, price=100.00
+        )
+        self.day = date.today() + timedelta(days=1)
+
+    def test_compute_free_slots_empty_day(self):
+        slots = compute_free_slots(self.day, time(9, 0), time(11, 0), 40, [])
+        self.assertEqual(slots, ['09:00', '09:30', '10:00', '10:30'])
+
+    def test_compute_free_slots_skips_slots_containing_a_booking(self):
+        start = timezone.make_aware(datetime.combine(self.day, time(10, 0)))
+        slots = compute_free_slots(self.day, time(9, 0), time(11, 0), 40, [(start, start + timedelta(minutes=40))])
+        self.assertEqual(slots, ['09:00'])
+
+    def test_existing_booking_duration_blocks_later_slots(self):
+        Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(9, 0), status='confirmed'
+        )
+        # The 09:00 haircut runs until 09:40, so 09:30 is no longer offered
+        self.assertEqual(get_available_slots(self.barber, self.day, self.service), ['10:00', '10:30'])
+
+    def test_booking_stores_appointment_interval(self):
+        booking = Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(9, 0), status='confirmed'
+        )
+        booking.refresh_from_db()
+        self.assertEqual(timezone.localtime(booking.appointment_start).time(), time(9, 0))
+        self.assertEqual(booking.appointment_end - booking.appointment_start, timedelta(minutes=40))
+
+    def test_booking_spanning_midnight_blocks_next_day(self):
+        late_barber = Barber.objects.create_user(
+            username='late_barber', password='testpass123',
+            work_start_time=time(0, 0), work_end_time=time(1, 0)
+        )
+        Booking.objects.create(
+            barber=late_barber, appointment_date=self.day, appointment_time=time(23, 50), status='confirmed'
+        )
+        slots = get_available_slots(late_barber, self.day + timedelta(days=1), self.service)
+        self.assertEqual(slots, ['00:30'])
+
+    def test_get_available_slots_uses_single_query(self):
+        Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(9, 30), status='confirmed'
+        )
+        Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(10, 30), status='cancelled'
+        )
+        with self.assertNumQueries(1):
+            slots = get_available_slots(self.barber, self.day, self.service)
+        self.assertEqual(slots, ['10:30'])
+
+    def test_ajax_view_returns_slots(self):
+        response = DjangoTestClient().get(
+            reverse('get_available_slots_ajax', kwargs={'username': 'slot_barber'}),
+            {'date': self.day.strftime('%Y-%m-%d'), 'service': self.service.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['available_slots'], ['09:00', '09:30', '10:00', '10:30'])
+
+    def test_get_available_days_uses_single_query(self):
+        Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(9, 30), status='pending'
+        )
+        # Early enough that none of today's slots has passed
+        now = timezone.make_aware(datetime.combine(date.today(), time(6, 0)))
+        with self.assertNumQueries(1), mock.patch('django.utils.timezone.now', return_value=now):
+            days = get_available_days(self.barber, self.service, date.today(), days=3)
+        self.assertEqual(len(days), 4)
+        self.assertEqual(days[self.day], ['10:30'])
+        self.assertEqual(days[date.today()], ['09:00', '09:30', '10:00', '10:30'])
+
+    def test_calendar_view_reports_full_days_and_next_available(self):
+        for slot in [time(9, 0), time(9, 30), time(10, 0), time(10, 30)]:
+            Booking.objects.create(
+                barber=self.barber, service=self.service, appointment_date=timezone.localdate(),
+                appointment_time=slot, status='confirmed'
+            )
+        response = DjangoTestClient().get(
+            reverse('get_availability_calendar_ajax', kwargs={'username': 'slot_barber'}),
+            {'service': self.service.id}
+        )
+        data = response.json()
+        self.assertEqual(len(data['days']), 15)
+        self.assertTrue(data['days'][0]['full'])
+        self.assertEqual(data['next_available'], {
+            'date': (timezone.localdate() + timedelta(days=1)).strftime('%Y-%m-%d'),
+            'time': '09:00',
+        })
+
+    def test_calendar_view_skips_slots_that_have_passed(self):
+        today = timezone.localdate()
+        now = timezone.make_aware(datetime.combine(today, time(10, 15)))
+        url = reverse('get_availability_calendar_ajax', kwargs={'username': 'slot_barber'})
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            data = DjangoTestClient().get(url, {'service': self.service.id}).json()
+            # Served from the cache the second time, still trimmed
+            self.assertEqual(DjangoTestClient().get(url, {'service': self.service.id}).json(), data)
+            self.assertEqual(get_available_slots(self.barber, today, self.service), ['10:30'])
+        self.assertEqual(data['days'][0]['available_slots'], ['10:30'])
+        self.assertEqual(data['next_available'], {'date': today.strftime('%Y-%m-%d'), 'time': '10:30'})
+        self.assertEqual(data['days'][1]['available_slots'], ['09:00', '09:30', '10:00', '10:30'])
+
+    def test_cache_stats_are_shared_and_reported(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        get_available_slots(self.barber, self.day, self.service)
+        get_available_days(self.barber, self.service, self.day, days=1)
+        # Counted in the cache, not in this process
+        self.assertEqual(cache.get('availability:stats:hits'), 1)
+        self.assertEqual(get_availability_cache_stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
+
+        out = StringIO()
+        call_command('availability_cache_stats', '--reset', stdout=out)
+        self.assertIn('Hits: 1  Misses: 2  Hit ratio: 33.3%', out.getvalue())
+        self.assertEqual(get_availability_cache_stats()['hits'], 0)
+
+    def test_slots_are_cached_until_a_booking_changes(self):
+        get_available_slots(self.barber, self.day, self.service)
+        stats = get_availability_cache_stats()
+        with self.assertNumQueries(0):
+            slots = get_available_slots(self.barber, self.day, self.service)
+        self.assertEqual(slots, ['09:00', '09:30', '10:00', '10:30'])
+        self.assertEqual(get_availability_cache_stats()['hits'], stats['hits'] + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                barber=self.barber, service=self.service, appointment_date=self.day,
+                appointment_time=time(10, 0), status='pending'
+            )
+        self.assertEqual(get_available_slots(self.barber, self.day, self.service), ['09:00'])
+
+        # Cancelling frees the slot again
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'cancelled'
+            booking.save()
+        self.assertEqual(
+            get_available_slots(self.barber, self.day, self.service),
+            ['09:00', '09:30', '10:00', '10:30']
+        )
+
+    def test_moving_a_booking_invalidates_the_old_day(self):
+        booking = Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(10, 0), status='confirmed'
+        )
+        self.assertEqual(get_available_slots(self.barber, self.day, self.service), ['09:00'])
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.appointment_date = self.day + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        self.assertEqual(
+            get_available_slots(self.barber, self.day, self.service),
+            ['09:00', '09:30', '10:00', '10:30']
+        )
+
+    def test_cache_is_invalidated_only_after_commit(self):
+        get_available_slots(self.barber, self.day, self.service)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Booking.objects.create(
+                barber=self.barber, service=self.service, appointment_date=self.day,
+                appointment_time=time(10, 0), status='pending'
+            )
+            # A reader before commit still sees (and may cache) the old version
+            self.assertEqual(get_available_slots(self.barber, self.day, self.service), ['09:00', '09:30', '10:00', '10:30'])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(get_available_slots(self.barber, self.day, self.service), ['09:00'])
+
+    def test_calendar_reuses_cached_days(self):
+        get_available_slots(self.barber, self.day, self.service)
+        with self.assertNumQueries(1):
+            days = get_available_days(self.barber, self.service, date.today(), days=3)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_available_days(self.barber, self.service, date.today(), days=3), days)
+
+
+class TestBookingReservation(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(
+            username='reserve_barber', password='testpass123', sms_notifications_enabled=False
+        )
+        self.service = Service.objects.create(
+            barber=self.barber, name='Haircut', duration_minutes=40, price=100.00
+        )
+        self.day = date.today() + timedelta(days=1)
+        Booking.objects.create(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(10, 0), status='pending'
+        )
+
+    def test_reserve_rejects_overlapping_booking(self):
+        booking = Booking(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(10, 30), status='pending'
+        )
+        with self.assertRaises(SlotUnavailable):
+            reserve_booking(booking)
+        self.assertIsNone(booking.pk)
+
+    def test_reserve_accepts_adjacent_booking(self):
+        booking = reserve_booking(Booking(
+            barber=self.barber, service=self.service, appointment_date=self.day,
+            appointment_time=time(10, 40), status='pending'
+        ))
+        self.assertIsNotNone(booking.pk)
+
+    def test_longer_service_duration_extends_booked_interval(self):
+        self.barber.refresh_from_db()
+        self.assertIn('11:00', get_available_slots(self.barber, self.day, self.service))
+        service = Service.objects.get(pk=self.service.pk)
+        service.duration_minutes = 90
+        with self.captureOnCommitCallbacks(execute=True):
+            service.save()
+
+        booking = Booking.objects.get(barber=self.barber)
+        self.assertEqual(booking.appointment_end - booking.appointment_start, timedelta(minutes=90))
+        self.assertNotIn('11:00', get_available_slots(self.barber, self.day, service))
+        with self.assertRaises(SlotUnavailable):
+            reserve_booking(Booking(
+                barber=self.barber, service=service, appointment_date=self.day,
+                appointment_time=time(11, 0), status='pending'
+            ))
+
+    def test_queryset_delete_frees_booked_slot(self):
+        self.barber.refresh_from_db()
+        self.assertNotIn('10:00', get_available_slots(self.barber, self.day, self.service))
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(barber=self.barber).delete()
+        self.assertIn('10:00', get_available_slots(self.barber, self.day, self.service))
+
+    def test_public_booking_for_taken_slot_returns_conflict(self):
+        response = DjangoTestClient().post(reverse('public_booking', kwargs={'username': 'reserve_barber'}), {
+            'name': 'Late Client',
+            'phone': '0334455667',
+            'service': self.service.id,
+            'appointment_date': self.day,
+            'appointment_time': '10:00',
+        })
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'just taken', status_code=409)
+        self.assertEqual(Booking.objects.filter(barber=self.barber).count(), 1)
+        self.assertFalse(Client.objects.filter(phone='0334455667').exists())
+
+
+class TestSlotHolds(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(
+            username='hold_barber', password='testpass123', sms_notifications_enabled=False,
+            work_start_time=time(9, 0), work_end_time=time(11, 0)
+        )
+        self.service = Service.objects.create(
+            barber=self.barber, name='Haircut', duration_minutes=30, price=100.00
+        )
+        self.day = date.today() + timedelta(days=1)
+
+    def test_held_slot_is_busy_until_released(self):
+        self.assertIn('09:30', get_available_slots(self.barber, self.day, self.service))
+        with self.captureOnCommitCallbacks(execute=True):
+            hold = hold_slot(self.barber, self.service, self.day, time(9, 30))
+        self.assertNotIn('09:30', get_available_slots(self.barber, self.day, self.service))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            hold_slot(self.barber, self.service, self.day, time(10, 0), replace_token=hold.token)
+        slots = get_available_slots(self.barber, self.day, self.service)
+        self.assertIn('09:30', slots)
+        self.assertNotIn('10:00', slots)
+
+    def test_cannot_hold_or_book_a_held_slot(self):
+        hold_slot(self.barber, self.service, self.day, time(9, 30))
+        with self.assertRaises(SlotUnavailable):
+            hold_slot(self.barber, self.service, self.day, time(9, 30))
+        with self.assertRaises(SlotUnavailable):
+            reserve_booking(Booking(
+                barber=self.barber, service=self.service, appointment_date=self.day,
+                appointment_time=time(9, 30), status='pending'
+            ))
+
+    def test_expired_holds_are_ignored_and_reclaimed(self):
+        hold = hold_slot(self.barber, self.service, self.day, time(9, 30))
+        SlotHold.objects.filter(pk=hold.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        cache.clear()
+        self.assertIn('09:30', get_available_slots(self.barber, self.day, self.service))
+        hold_slot(self.barber, self.service, self.day, time(9, 30))
+        self.assertFalse(SlotHold.objects.filter(pk=hold.pk).exists())
+
+    def test_public_booking_converts_hold_into_booking(self):
+        client = DjangoTestClient()
+        response = client.post(reverse('hold_slot_ajax', kwargs={'username': 'hold_barber'}), {
+            'date': self.day.strftime('%Y-%m-%d'), 'time': '09:30', 'service': self.service.id,
+        })
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['token']
+
+        response = client.post(reverse('public_booking', kwargs={'username': 'hold_barber'}), {
+            'name': 'Held Client',
+            'phone': '0334455667',
+            'service': self.service.id,
+            'appointment_date': self.day,
+            'appointment_time': '09:30',
+            'hold_token': token,
+        })
+        self.assertRedirects(response, reverse('booking_success'))
+        self.assertFalse(SlotHold.objects.exists())
+        self.assertTrue(Booking.objects.filter(barber=self.barber, appointment_time=time(9, 30)).exists())
+
+    def test_only_offered_times_can_be_held(self):
+        for date_obj, time_obj in [
+            (self.day, time(9, 15)),
+            (self.day, time(11, 0)),
+            (self.day, time(8, 30)),
+            (self.day - timedelta(days=2), time(9, 30)),
+            (date.today() + timedelta(days=BOOKING_WINDOW_DAYS + 1), time(9, 30)),
+        ]:
+            with self.assertRaises(ValueError):
+                hold_slot(self.barber, self.service, date_obj, time_obj)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_new_hold_replaces_the_sessions_previous_hold(self):
+        client = DjangoTestClient()
+        url = reverse('hold_slot_ajax', kwargs={'username': 'hold_barber'})
+        for slot in ['09:00', '09:30', '10:00']:
+            response = client.post(url, {'date': self.day.strftime('%Y-%m-%d'), 'time': slot, 'service': self.service.id})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(SlotHold.objects.values_list('token', flat=True)), [response.json()['token']])
+
+        response = client.post(url, {'date': self.day.strftime('%Y-%m-%d'), 'time': '10:45', 'service': self.service.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(SlotHold.objects.count(), 1)
+
+    def test_live_holds_are_capped_per_client_and_per_barber(self):
+        url = reverse('hold_slot_ajax', kwargs={'username': 'hold_barber'})
+
+        def hold(slot, ip):
+            # A fresh client each time, as if the session cookie were dropped
+            return DjangoTestClient(REMOTE_ADDR=ip).post(
+                url, {'date': self.day.strftime('%Y-%m-%d'), 'time': slot, 'service': self.service.id}
+            ).status_code
+
+        with mock.patch('barber.availability.SLOT_HOLDS_PER_CLIENT', 2), \
+                mock.patch('barber.availability.SLOT_HOLDS_PER_BARBER', 3):
+            self.assertEqual(hold('09:00', '10.0.0.1'), 201)
+            self.assertEqual(hold('09:30', '10.0.0.1'), 201)
+            self.assertEqual(hold('10:00', '10.0.0.1'), 429)
+            self.assertEqual(hold('10:00', '10.0.0.2'), 201)
+            self.assertEqual(hold('10:30', '10.0.0.3'), 429)
+
+            # Expired holds no longer count
+            SlotHold.objects.filter(client_ip='10.0.0.1').update(expires_at=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(hold('10:30', '10.0.0.3'), 201)
+
+
+# ==================== QUEUE TESTS ====================
+
+from barber import queue as queue_ops
+
+
+class TestQueueOrdering(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='queue_barber', password='testpass123')
+        self.bookings = [
+            Booking.objects.create(barber=self.barber, client_name=f'Client {i}', status='waiting', is_walkin=True)
+            for i in range(4)
+        ]
+
+    def queue_names(self):
+        return [b.client_name for b in queue_ops.get_waiting_queue(self.barber)]
+
+    def test_remove_only_writes_removed_row(self):
+        with self.assertNumQueries(1):
+            queue_ops.remove_from_queue(self.bookings[1])
+        self.assertEqual(self.queue_names(), ['Client 0', 'Client 2', 'Client 3'])
+
+    def test_move_compacts_once_then_uses_gaps(self):
+        queue_ops.move_in_queue(self.bookings[3], -1)
+        self.assertEqual(self.queue_names(), ['Client 0', 'Client 1', 'Client 3', 'Client 2'])
+
+        # Positions are now spaced out, so the next move writes a single row
+        with self.assertNumQueries(2):
+            queue_ops.move_in_queue(self.bookings[0], 1)
+        self.assertEqual(self.queue_names(), ['Client 1', 'Client 0', 'Client 3', 'Client 2'])
+
+    def test_move_to_front_and_back(self):
+        queue_ops.move_in_queue(self.bookings[2], -5)
+        queue_ops.move_in_queue(self.bookings[0], 5)
+        self.assertEqual(self.queue_names(), ['Client 2', 'Client 1', 'Client 3', 'Client 0'])
+
+    def test_move_view(self):
+        client = DjangoTestClient()
+        client.login(username='queue_barber', password='testpass123')
+        response = client.get(reverse('move_in_queue', kwargs={'booking_id': self.bookings[1].pk, 'direction': 'up'}))
+        self.assertRedirects(response, reverse('home'))
+        self.assertEqual(self.queue_names(), ['Client 1', 'Client 0', 'Client 2', 'Client 3'])
+
+    def test_positions_come_from_counter(self):
+        from barber.models import QueueCounter
+        counter = QueueCounter.objects.get(barber=self.barber)
+        self.assertEqual(counter.last_position, 4)
+        booking = Booking.objects.create(barber=self.barber, client_name='Client 4', status='waiting', is_walkin=True)
+        self.assertEqual(booking.queue_position, 5)
+
+        # Removing the last client does not hand its position out again
+        queue_ops.remove_from_queue(booking)
+        booking = Booking.objects.create(barber=self.barber, client_name='Client 5', status='waiting', is_walkin=True)
+        self.assertEqual(booking.queue_position, 6)
+
+    def test_counter_without_update_returning(self):
+        from django.db import connection
+        from barber.models import QueueCounter
+
+        # SQLite before 3.35 has no RETURNING, so the counter is read back after the update
+        with mock.patch.object(type(connection.features), 'can_return_columns_from_insert', False):
+            self.assertEqual(QueueCounter.allocate(self.barber.pk, 2), 6)
+        self.assertEqual(QueueCounter.objects.get(barber=self.barber).last_position, 6)
+
+    def test_duplicate_waiting_position_is_rejected(self):
+        from django.db import IntegrityError
+        with self.assertRaises(IntegrityError):
+            Booking.objects.create(
+                barber=self.barber, client_name='Duplicate', status='waiting',
+                queue_position=self.bookings[0].queue_position
+            )
+
+    def test_promote_due_appointments_in_one_update(self):
+        now = timezone.now()
+        local_now = timezone.localtime(now)
+        due = Booking.objects.create(
+            barber=self.barber, client_name='Due', status='confirmed',
+            appointment_date=local_now.date(),
+            appointment_time=(local_now - timedelta(minutes=1)).time()
+        )
+        later = Booking.objects.create(
+            barber=self.barber, client_name='Later', status='pending',
+            appointment_date=local_now.date(),
+            appointment_time=(local_now + timedelta(hours=1)).time()
+        )
+        if later.appointment_date != due.appointment_date:
+            self.skipTest('too close to midnight')
+
+        promoted = queue_ops.promote_due_appointments(now=now)
+        self.assertEqual(promoted, [due.pk])
+        due.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual(due.status, 'waiting')
+        self.assertEqual(due.queue_position, 5)
+        self.assertEqual(later.status, 'pending')
+        self.assertEqual(self.queue_names()[-1], 'Due')
+
+    def test_home_is_a_pure_read(self):
+        local_now = timezone.localtime()
+        Booking.objects.create(
+            barber=self.barber, client_name='Due', status='confirmed',
+            appointment_date=local_now.date(),
+            appointment_time=(local_now - timedelta(minutes=1)).time()
+        )
+        client = DjangoTestClient()
+        client.login(username='queue_barber', password='testpass123')
+        response = client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['queue']), 4)
+        self.assertFalse(Booking.objects.filter(client_name='Due', status='waiting').exists())
+
+
+# ==================== LIVE UPDATE TESTS ====================
+
+import asyncio
+from barber.events import InProcessBroker, queue_event_type
+
+
+class TestQueueEvents(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='event_barber', password='testpass123')
+        self.published = []
+        broker = InProcessBroker()
+        broker.publish = lambda barber_id, event: self.published.append(event)
+        patcher = mock.patch('barber.events._broker', broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_event_types(self):
+        self.assertEqual(queue_event_type(None, 'waiting'), 'added')
+        self.assertEqual(queue_event_type('pending', 'waiting'), 'added')
+        self.assertEqual(queue_event_type('waiting', 'waiting'), 'moved')
+        self.assertEqual(queue_event_type('waiting', 'in_progress'), 'started')
+        self.assertEqual(queue_event_type('in_progress', 'completed'), 'completed')
+        self.assertEqual(queue_event_type('waiting', 'removed'), 'removed')
+        self.assertIsNone(queue_event_type(None, 'pending'))
+
+    def test_queue_changes_are_published_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(barber=self.barber, client_name='Walk-in', status='waiting')
+        booking = Booking.objects.get(pk=booking.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'in_progress'
+            booking.timer_started_at = timezone.now()
+            booking.save()
+
+        self.assertEqual([event['type'] for event in self.published], ['added', 'started'])
+        self.assertEqual(self.published[0]['booking']['client_name'], 'Walk-in')
+        self.assertEqual(self.published[1]['booking']['timer_started_at'], booking.timer_started_at.isoformat())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertEqual(self.published[2]['type'], 'removed')
+
+    def test_broker_delivers_to_subscribers_of_the_barber(self):
+        broker = InProcessBroker()
+
+        async def scenario():
+            mine = broker.subscribe(1)
+            other = broker.subscribe(2)
+            # Publish from another thread, as a sync view would
+            await asyncio.to_thread(broker.publish, 1, {'type': 'added'})
+            event = await mine.get(timeout=1)
+            broker.unsubscribe(mine)
+            broker.unsubscribe(other)
+            return event, other.queue.empty()
+
+        event, other_empty = asyncio.run(scenario())
+        self.assertEqual(event, {'type': 'added'})
+        self.assertTrue(other_empty)
+
+    def test_stream_is_not_opened_under_wsgi(self):
+        client = DjangoTestClient()
+        client.force_login(self.barber)
+        response = client.get(reverse('queue_events'))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+        self.assertNotContains(client.get(reverse('home')), 'EventSource(')
+
+    async def test_stream_under_asgi(self):
+        from django.test import AsyncClient
+
+        client = AsyncClient()
+        await client.aforce_login(self.barber)
+        response = await client.get(reverse('queue_events'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertEqual(await anext(chunks), b'retry: 3000\n\n')
+        await chunks.aclose()
+
+        response = await client.get(reverse('home'))
+        self.assertContains(response, 'EventSource(')
+
+
+class TestQueueSnapshot(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(username='snapshot_barber', password='testpass123')
+        self.client = DjangoTestClient()
+        self.client.login(username='snapshot_barber', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(barber=self.barber, client_name='First', status='waiting', is_walkin=True)
+
+    def test_snapshot_lists_queue_with_etag(self):
+        response = self.client.get(reverse('queue_snapshot'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        data = response.json()
+        self.assertIsNone(data['active_booking'])
+        self.assertEqual([(b['position'], b['client_name']) for b in data['queue']], [(1, 'First')])
+
+    def test_unchanged_queue_returns_304_without_reading_bookings(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        etag = self.client.get(reverse('queue_snapshot'))['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('queue_snapshot'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(any('barber_booking' in query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(barber=self.barber, client_name='Second', status='waiting', is_walkin=True)
+        response = self.client.get(reverse('queue_snapshot'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['queue']), 2)
+
+    def test_deleting_a_queued_booking_changes_the_etag(self):
+        etag = self.client.get(reverse('queue_snapshot'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.filter(barber=self.barber, client_name='First').delete()
+        response = self.client.get(reverse('queue_snapshot'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['queue'], [])
+
+
+# ==== WAIT TIME TESTS ====
+
+class TestWaitTimes(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='wait_barber', password='testpass123')
+        self.haircut = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.beard = Service.objects.create(barber=self.barber, name='Beard', price=50, duration_minutes=15)
+        self.now = timezone.now()
+
+    def _completed(self, service, minutes):
+        start = self.now - timedelta(hours=3)
+        return Booking.objects.create(
+            barber=self.barber, service=service, client_name='Done', status='completed',
+            timer_started_at=start, timer_ended_at=start + timedelta(minutes=minutes)
+        )
+
+    def test_percentile_interpolates(self):
+        from barber.waittimes import percentile
+
+        self.assertEqual(percentile([10, 20, 30, 40], 50), 25)
+        self.assertEqual(percentile([10, 20, 30, 40, 50], 90), 46)
+        self.assertIsNone(percentile([], 50))
+
+    def test_record_updates_service_and_overall_stats(self):
+        from barber.models import ServiceDurationStats
+        from barber.waittimes import record_service_duration
+
+        for minutes in (20, 40, 30):
+            record_service_duration(self._completed(self.haircut, minutes))
+        record_service_duration(self._completed(self.beard, 10))
+
+        haircut = ServiceDurationStats.objects.get(barber=self.barber, service=self.haircut)
+        self.assertEqual(haircut.sample_count, 3)
+        self.assertEqual(haircut.recent_minutes, [20, 40, 30])
+        self.assertEqual(haircut.median_minutes, 30)
+        self.assertEqual(haircut.p90_minutes, 38)
+        overall = ServiceDurationStats.objects.get(barber=self.barber, service__isnull=True)
+        self.assertEqual(overall.sample_count, 4)
+        self.assertEqual(overall.median_minutes, 25)
+
+    def test_record_ignores_unusable_timers(self):
+        from barber.models import ServiceDurationStats
+        from barber.waittimes import record_service_duration
+
+        record_service_duration(self._completed(self.haircut, 0))
+        record_service_duration(self._completed(self.haircut, 60 * 12))
+        self.assertFalse(ServiceDurationStats.objects.exists())
+
+    def test_rolling_window_keeps_recent_samples(self):
+        from barber.models import ServiceDurationStats
+        from barber.waittimes import record_service_duration
+
+        with mock.patch('barber.waittimes.ROLLING_WINDOW', 3):
+            for minutes in (100, 100, 20, 20, 20):
+                record_service_duration(self._completed(self.haircut, minutes))
+        stats = ServiceDurationStats.objects.get(barber=self.barber, service=self.haircut)
+        self.assertEqual(stats.recent_minutes, [20, 20, 20])
+        self.assertEqual(stats.sample_count, 5)
+        self.assertEqual(stats.median_minutes, 20)
+
+    def test_rebuild_matches_incremental_updates(self):
+        from barber.models import ServiceDurationStats
+        from barber.waittimes import rebuild_duration_stats, record_service_duration
+
+        for minutes in (20, 40, 30):
+            record_service_duration(self._completed(self.haircut, minutes))
+        expected = list(ServiceDurationStats.objects.order_by('service_id').values_list('service_id', 'sample_count', 'median_minutes'))
+
+        self.assertEqual(rebuild_duration_stats(self.barber), 2)
+        rebuilt = list(ServiceDurationStats.objects.order_by('service_id').values_list('service_id', 'sample_count', 'median_minutes'))
+        self.assertEqual(rebuilt, expected)
+
+    def test_estimates_accumulate_through_queue(self):
+        from barber.waittimes import estimate_wait_times, record_service_duration
+
+        for minutes in (40, 40):
+            record_service_duration(self._completed(self.haircut, minutes))
+        active = Booking.objects.create(
+            barber=self.barber, service=self.haircut, client_name='Chair', status='in_progress',
+            timer_started_at=self.now - timedelta(minutes=10)
+        )
+        first = Booking.objects.create(barber=self.barber, service=self.beard, client_name='A', status='waiting')
+        second = Booking.objects.create(barber=self.barber, service=None, client_name='B', status='waiting', is_walkin=True)
+        third = Booking.objects.create(barber=self.barber, service=self.haircut, client_name='C', status='waiting')
+
+        estimates = estimate_wait_times(self.barber, active, [first, second, third], self.now)
+        # 40 min median minus 10 elapsed, then beard falls back to its listed 15 min,
+        # the walk-in without a service uses the overall median of 40
+        self.assertEqual(estimates, {active.pk: 30, first.pk: 30, second.pk: 45, third.pk: 85})
+
+    def test_overrunning_service_does_not_go_negative(self):
+        from barber.waittimes import estimate_wait_times
+
+        active = Booking.objects.create(
+            barber=self.barber, service=self.haircut, client_name='Chair', status='in_progress',
+            timer_started_at=self.now - timedelta(minutes=45)
+        )
+        waiting = Booking.objects.create(barber=self.barber, service=self.haircut, client_name='A', status='waiting')
+        self.assertEqual(estimate_wait_times(self.barber, active, [waiting], self.now), {active.pk: 0, waiting.pk: 0})
+
+    def test_booking_complete_records_duration(self):
+        from barber.models import ServiceDurationStats
+
+        booking = Booking.objects.create(
+            barber=self.barber, service=self.haircut, client_name='Chair', status='in_progress',
+            timer_started_at=timezone.now() - timedelta(minutes=25)
+        )
+        client = DjangoTestClient()
+        client.login(username='wait_barber', password='testpass123')
+        response = client.post(reverse('booking_complete', args=[booking.pk]), {'payment_method': 'cash'})
+        self.assertEqual(response.status_code, 302)
+
+        stats = ServiceDurationStats.objects.get(barber=self.barber, service=self.haircut)
+        self.assertEqual(stats.sample_count, 1)
+        self.assertAlmostEqual(stats.median_minutes, 25, delta=1)
+
+    def test_home_and_snapshot_show_estimates(self):
+        Booking.objects.create(barber=self.barber, service=self.haircut, client_name='A', status='waiting')
+        Booking.objects.create(barber=self.barber, service=self.haircut, client_name='B', status='waiting')
+        client = DjangoTestClient()
+        client.login(username='wait_barber', password='testpass123')
+
+        response = client.get(reverse('home'))
+        self.assertEqual([b.estimated_wait_minutes for b in response.context['queue']], [0, 30])
+
+        data = client.get(reverse('queue_snapshot')).json()
+        self.assertEqual([b['estimated_wait_minutes'] for b in data['queue']], [0, 30])
+        self.assertIn('generated_at', data)
+
+
+# ==== DASHBOARD TESTS ====
+
+class TestDashboardStats(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(username='stats_barber', password='testpass123')
+        self.haircut = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.beard = Service.objects.create(barber=self.barber, name='Beard', price=50, duration_minutes=15)
+        self.today = date(2026, 3, 18)  # a Wednesday
+
+    def _income(self, service, amount, day):
+        return Income.objects.create(barber=self.barber, service=service, amount=amount, payment_method='cash', date=day)
+
+    def test_period_stats_from_one_query(self):
+        from barber.dashboard import get_period_stats
+
+        self._income(self.haircut, 100, self.today)
+        self._income(self.beard, 50, self.today)
+        self._income(self.haircut, 100, date(2026, 3, 16))  # Monday, same week
+        self._income(self.haircut, 100, date(2026, 3, 2))  # earlier this month
+        self._income(None, 80, date(2026, 2, 20))  # last month
+        other = Barber.objects.create_user(username='other_stats_barber', password='testpass123')
+        Income.objects.create(barber=other, amount=999, payment_method='cash', date=self.today)
+
+        with self.assertNumQueries(1):
+            stats = get_period_stats(self.barber, self.today)
+
+        self.assertEqual(stats['daily_income'], 150)
+        self.assertEqual(stats['weekly_income'], 250)
+        self.assertEqual(stats['monthly_income'], 350)
+        self.assertEqual(stats['daily_services'], [
+            {'service__name': 'Beard', 'count': 1}, {'service__name': 'Haircut', 'count': 1},
+        ])
+        self.assertEqual(stats['weekly_services'], [
+            {'service__name': 'Beard', 'count': 1}, {'service__name': 'Haircut', 'count': 2},
+        ])
+        self.assertEqual(stats['monthly_services'], [
+            {'service__name': 'Beard', 'count': 1}, {'service__name': 'Haircut', 'count': 3},
+        ])
+
+    def test_week_spanning_previous_month_is_included(self):
+        from barber.dashboard import get_period_stats
+
+        today = date(2026, 4, 1)  # Wednesday, week started in March
+        self._income(self.haircut, 100, date(2026, 3, 30))
+        self._income(self.beard, 50, today)
+        stats = get_period_stats(self.barber, today)
+        self.assertEqual(stats['weekly_income'], 150)
+        self.assertEqual(stats['monthly_income'], 50)
+        self.assertEqual(stats['daily_services'], [{'service__name': 'Beard', 'count': 1}])
+
+    def test_empty_periods(self):
+        from barber.dashboard import get_period_stats
+
+        stats = get_period_stats(self.barber, self.today)
+        self.assertEqual(stats['daily_income'], 0)
+        self.assertEqual(stats['monthly_services'], [])
+
+    def test_selected_month_summary(self):
+        client = DjangoTestClient()
+        client.login(username='stats_barber', password='testpass123')
+        self._income(self.haircut, 100, date(2025, 11, 3))
+        self._income(self.haircut, 100, date(2025, 11, 20))
+        self._income(None, 40, date(2025, 11, 21))
+        self._income(self.beard, 50, date(2025, 12, 1))
+
+        response = client.get(reverse('dashboard'), {'month': '2025-11'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['selected_month_income'], 240)
+        self.assertEqual(response.context['selected_month_services'], [
+            {'service__name': 'Haircut', 'count': 2}, {'service__name': None, 'count': 1},
+        ])
+        self.assertEqual(len(response.context['selected_month_transactions']), 3)
+
+    def test_chart_buckets_months(self):
+        client = DjangoTestClient()
+        client.login(username='stats_barber', password='testpass123')
+        self._income(self.haircut, 100, date(2026, 3, 2))
+        self._income(self.haircut, 100, date(2026, 3, 18))
+        self._income(self.beard, 50, date(2026, 1, 31))
+        self._income(self.beard, 50, date(2025, 10, 1))
+        self._income(self.beard, 50, date(2025, 9, 30))  # outside the window
+
+        now = timezone.make_aware(datetime(2026, 3, 18, 12, 0))
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = client.get(reverse('dashboard'))
+        self.assertEqual(response.context['chart_labels'], ['Oct 25', 'Nov 25', 'Dec 25', 'Jan 26', 'Feb 26', 'Mar 26'])
+        self.assertEqual(response.context['chart_data'], [50.0, 0, 0, 50.0, 0, 200.0])
+
+
+
+class TestDashboardCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(username='cache_barber', password='testpass123')
+        self.haircut = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.client = DjangoTestClient()
+        self.client.login(username='cache_barber', password='testpass123')
+        self.today = timezone.now().date()
+
+    def _income(self, amount, day=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Income.objects.create(
+                barber=self.barber, service=self.haircut, amount=amount, payment_method='cash', date=day or self.today
+            )
+
+    def _rollup_queries(self, *args, **kwargs):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard'), *args, **kwargs)
+        return response, [q for q in queries if 'barber_dailyincomerollup' in q['sql']]
+
+    def test_stats_served_from_cache_until_income_changes(self):
+        self._income(100)
+        response, queries = self._rollup_queries()
+        self.assertEqual(response.context['daily_income'], 100)
+        self.assertEqual(len(queries), 2)
+
+        response, queries = self._rollup_queries()
+        self.assertEqual(response.context['daily_income'], 100)
+        self.assertEqual(queries, [])
+
+        self._income(50)
+        response, queries = self._rollup_queries()
+        self.assertEqual(response.context['daily_income'], 150)
+        self.assertEqual(len(queries), 2)
+
+    def test_booking_complete_invalidates(self):
+        self.client.get(reverse('dashboard'))
+        booking = Booking.objects.create(
+            barber=self.barber, service=self.haircut, client_name='Chair', status='in_progress',
+            timer_started_at=timezone.now() - timedelta(minutes=20)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('booking_complete', args=[booking.pk]), {'payment_method': 'card'})
+        self.assertEqual(self.client.get(reverse('dashboard')).context['daily_income'], 100)
+
+    def test_past_month_cached_separately(self):
+        from barber import dashboard
+
+        past = (self.today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        self._income(80, past)
+        month = past.strftime('%Y-%m')
+
+        with mock.patch.object(dashboard, 'PAST_MONTH_CACHE_TIMEOUT', 12345), \
+                mock.patch.object(dashboard._cache(), 'set', wraps=dashboard._cache().set) as cache_set:
+            response = self.client.get(reverse('dashboard'), {'month': month})
+        self.assertEqual(response.context['selected_month_income'], 80)
+        self.assertIn(12345, [call.args[2] for call in cache_set.call_args_list])
+
+        # Income in the current month leaves the past month's entry alone
+        self._income(100)
+        response, queries = self._rollup_queries({'month': month})
+        self.assertEqual(response.context['selected_month_income'], 80)
+        self.assertEqual(len(queries), 2)  # only the current-period stats were recomputed
+
+        # Back-dated income into that month does invalidate it
+        self._income(20, past)
+        response = self.client.get(reverse('dashboard'), {'month': month})
+        self.assertEqual(response.context['selected_month_income'], 100)
+
+    def test_service_rename_invalidates_breakdown(self):
+        self._income(100)
+        self.client.get(reverse('dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.haircut.name = 'Fade'
+            self.haircut.save()
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['daily_services'], [{'service__name': 'Fade', 'count': 1}])
+
+
+# ==== INCOME ROLLUP TESTS ====
+
+class TestIncomeRollup(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='rollup_barber', password='testpass123')
+        self.haircut = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.beard = Service.objects.create(barber=self.barber, name='Beard', price=50, duration_minutes=15)
+        self.day = date(2026, 3, 18)
+
+    def _rollups(self):
+        from barber.models import DailyIncomeRollup
+        return [
+            (r.date, r.service_id, r.payment_method, r.count, r.total, r.credit_outstanding, r.credit_unpaid_count)
+            for r in DailyIncomeRollup.objects.filter(barber=self.barber, count__gt=0).order_by('date', 'service_id', 'payment_method')
+        ]
+
+    def _rebuilt(self):
+        from barber.rollups import rebuild_income_rollup
+        rebuild_income_rollup(barber_id=self.barber.pk)
+        return self._rollups()
+
+    def test_create_adds_to_rollup(self):
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        Income.objects.create(barber=self.barber, service=self.beard, amount=50, payment_method='credit', date=self.day)
+        self.assertEqual(self._rollups(), [
+            (self.day, self.haircut.pk, 'cash', 2, 200, 0, 0),
+            (self.day, self.beard.pk, 'credit', 1, 50, 50, 1),
+        ])
+
+    def test_update_moves_contribution(self):
+        income = Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        income = Income.objects.get(pk=income.pk)
+        income.payment_method = 'card'
+        income.amount = 120
+        income.date = date(2026, 3, 19)
+        income.save()
+        self.assertEqual(self._rollups(), [(date(2026, 3, 19), self.haircut.pk, 'card', 1, 120, 0, 0)])
+        self.assertEqual(self._rollups(), self._rebuilt())
+
+    def test_credit_paid_clears_outstanding(self):
+        income = Income.objects.create(barber=self.barber, service=self.beard, amount=50, payment_method='credit', date=self.day)
+        client = DjangoTestClient()
+        client.login(username='rollup_barber', password='testpass123')
+        client.get(reverse('mark_credit_paid', args=[income.pk]))
+        self.assertEqual(self._rollups(), [(self.day, self.beard.pk, 'credit', 1, 50, 0, 0)])
+
+    def test_delete_removes_contribution(self):
+        income = Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        income.delete()
+        self.assertEqual(self._rollups(), [(self.day, self.haircut.pk, 'cash', 1, 100, 0, 0)])
+
+    def test_queryset_delete_removes_contribution(self):
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='card', date=self.day)
+        Income.objects.create(barber=self.barber, service=self.beard, amount=50, payment_method='credit', date=self.day)
+        Income.objects.filter(barber=self.barber).exclude(payment_method='card').delete()
+        self.assertEqual(self._rollups(), [(self.day, self.haircut.pk, 'card', 1, 100, 0, 0)])
+        self.assertEqual(self._rollups(), self._rebuilt())
+
+    def test_deleting_barber_removes_income_and_rollups(self):
+        from barber.models import DailyIncomeRollup
+
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        self.barber.delete()
+        self.assertFalse(Income.objects.exists())
+        self.assertFalse(DailyIncomeRollup.objects.exists())
+
+    def test_deleting_service_refiles_income(self):
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        Income.objects.create(barber=self.barber, service=None, amount=40, payment_method='cash', date=self.day)
+        self.haircut.delete()
+        self.assertEqual(self._rollups(), [(self.day, None, 'cash', 2, 140, 0, 0)])
+
+    def test_queryset_delete_of_service_refiles_income(self):
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        Income.objects.create(barber=self.barber, service=self.beard, amount=50, payment_method='card', date=self.day)
+        Service.objects.filter(barber=self.barber).delete()
+        self.assertEqual(self._rollups(), [
+            (self.day, None, 'card', 1, 50, 0, 0),
+            (self.day, None, 'cash', 1, 100, 0, 0),
+        ])
+        self.assertEqual(self._rollups(), self._rebuilt())
+
+    def test_rebuild_repairs_drift(self):
+        from barber.models import DailyIncomeRollup
+
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        expected = self._rollups()
+        DailyIncomeRollup.objects.update(total=5, count=9)
+        self.assertEqual(self._rebuilt(), expected)
+
+    def test_rebuild_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from barber.models import DailyIncomeRollup
+
+        Income.objects.create(barber=self.barber, service=self.haircut, amount=100, payment_method='cash', date=self.day)
+        DailyIncomeRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_income_rollup', '--barber', 'rollup_barber', stdout=out)
+        self.assertIn('Rebuilt 1 rollup row(s)', out.getvalue())
+        self.assertEqual(self._rollups(), [(self.day, self.haircut.pk, 'cash', 1, 100, 0, 0)])
+
+    def test_credit_list_totals_from_rollup(self):
+        today = timezone.now().date()
+        Income.objects.create(barber=self.barber, service=self.beard, amount=50, payment_method='credit', date=today)
+        Income.objects.create(barber=self.barber, service=self.beard, amount=50, payment_method='credit', date=today, credit_paid=True)
+        client = DjangoTestClient()
+        client.login(username='rollup_barber', password='testpass123')
+        response = client.get(reverse('credit_list'))
+        self.assertEqual(response.context['total_credit'], 50)
+        self.assertEqual(response.context['paid_count'], 1)
+        self.assertEqual(response.context['unpaid_count'], 1)
+
+
+# ==== RECEIVABLES TESTS ====
+
+class TestReceivables(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='credit_barber', password='testpass123')
+        self.service = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.sam = Client.objects.create(barber=self.barber, name='Sam', surname='Lee', phone='0820000001', age_group='adult', gender='male')
+        self.jo = Client.objects.create(barber=self.barber, name='Jo', surname='Ndlovu', phone='0820000002', age_group='adult', gender='female')
+        self.today = date(2026, 5, 20)
+
+    def _credit(self, client, amount, days_ago, paid=False):
+        return Income.objects.create(
+            barber=self.barber, client=client, service=self.service, amount=amount,
+            payment_method='credit', credit_paid=paid, date=self.today - timedelta(days=days_ago)
+        )
+
+    def test_aging_buckets_and_totals_in_one_query(self):
+        from barber.receivables import get_receivables
+
+        self._credit(self.sam, 100, 5)
+        self._credit(self.sam, 100, 45)
+        self._credit(self.sam, 50, 90)
+        self._credit(self.jo, 80, 30)
+        self._credit(self.jo, 80, 2, paid=True)
+        self._credit(self.jo, 80, 120, paid=True)  # paid in an earlier month, not shown
+        Income.objects.create(barber=self.barber, amount=60, payment_method='cash', date=self.today)
+
+        with self.assertNumQueries(1):
+            summary, totals = get_receivables(self.barber, self.today)
+
+        self.assertEqual(
+            [(row['client__name'], row['total_owed'], row['unpaid_count'], row['owed_0_30'], row['owed_31_60'], row['owed_61_plus'])
+             for row in summary],
+            [('Sam', 250, 3, 100, 100, 50), ('Jo', 80, 1, 80, None, None)],
+        )
+        self.assertEqual(summary[0]['oldest_unpaid'], self.today - timedelta(days=90))
+        self.assertEqual(totals, {
+            'total_credit': 330, 'unpaid_count': 4, 'paid_count': 1,
+            'owed_0_30': 180, 'owed_31_60': 100, 'owed_61_plus': 50,
+        })
+
+    def test_ledger_running_balance_per_client(self):
+        from barber.receivables import get_credit_ledger
+
+        old = self._credit(self.sam, 100, 45)
+        recent = self._credit(self.sam, 50, 3)
+        paid = self._credit(self.sam, 70, 1, paid=True)
+        jo = self._credit(self.jo, 80, 2)
+
+        balances = {income.pk: income.running_balance for income in get_credit_ledger(self.barber, self.today)}
+        self.assertEqual(balances, {old.pk: 100, recent.pk: 150, paid.pk: 150, jo.pk: 80})
+
+    def test_credit_list_view(self):
+        self._credit(self.sam, 100, 45)
+        client = DjangoTestClient()
+        client.login(username='credit_barber', password='testpass123')
+        now = timezone.make_aware(datetime(2026, 5, 20, 12, 0))
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = client.get(reverse('credit_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_credit'], 100)
+        self.assertEqual(response.context['owed_31_60'], 100)
+        self.assertContains(response, 'Sam Lee')
+
+
+# ==== PAGINATION TESTS ====
+
+class TestKeysetPagination(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='page_barber', password='testpass123')
+        self.client = DjangoTestClient()
+        self.client.login(username='page_barber', password='testpass123')
+
+    def _small_pages(self, queryset, ordering, cursor):
+        from barber.pagination import paginate
+        return paginate(queryset, ordering, cursor, 2)
+
+    def _walk(self, queryset, ordering, page_size):
+        from barber.pagination import paginate
+
+        pages = []
+        page = paginate(queryset, ordering, None, page_size)
+        pages.append([obj.pk for obj in page])
+        while page.has_next:
+            page = paginate(queryset, ordering, page.next_cursor, page_size)
+            pages.append([obj.pk for obj in page])
+        return pages, page
+
+    def test_pages_cover_ordering_with_ties(self):
+        day = date(2026, 1, 10)
+        for idx in range(7):
+            Income.objects.create(barber=self.barber, amount=10 + idx, payment_method='cash', date=day - timedelta(days=idx // 3))
+        queryset = Income.objects.filter(barber=self.barber)
+        expected = list(queryset.order_by('-date', '-created_at', '-pk').values_list('pk', flat=True))
+
+        pages, last = self._walk(queryset, ['-date', '-created_at', '-pk'], 3)
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        # Walking back from the last page returns the same pages
+        from barber.pagination import paginate
+        previous = paginate(queryset, ['-date', '-created_at', '-pk'], last.previous_cursor, 3)
+        self.assertEqual([obj.pk for obj in previous], pages[1])
+        self.assertTrue(previous.has_next)
+        first = paginate(queryset, ['-date', '-created_at', '-pk'], previous.previous_cursor, 3)
+        self.assertEqual([obj.pk for obj in first], pages[0])
+        self.assertFalse(first.has_previous)
+
+    def test_cursor_stable_when_rows_are_added(self):
+        from barber.pagination import paginate
+
+        for name in ['Adams', 'Brown', 'Cole', 'Dube']:
+            Client.objects.create(barber=self.barber, name='A', surname=name, phone=f'08{name}', age_group='adult', gender='male')
+        queryset = Client.objects.filter(barber=self.barber)
+        page = paginate(queryset, ['surname', 'name', 'pk'], None, 2)
+        Client.objects.create(barber=self.barber, name='A', surname='Aaron', phone='08new', age_group='adult', gender='male')
+        page = paginate(queryset, ['surname', 'name', 'pk'], page.next_cursor, 2)
+        self.assertEqual([c.surname for c in page], ['Cole', 'Dube'])
+
+    def test_tampered_cursor_starts_from_first_page(self):
+        from barber.pagination import paginate
+
+        Client.objects.create(barber=self.barber, name='A', surname='Adams', phone='081', age_group='adult', gender='male')
+        page = paginate(Client.objects.filter(barber=self.barber), ['surname', 'name', 'pk'], 'not-a-cursor', 2)
+        self.assertEqual([c.surname for c in page], ['Adams'])
+
+    def test_income_list_pages_keep_filters_and_use_rollup_total(self):
+        for idx in range(5):
+            Income.objects.create(barber=self.barber, amount=100, payment_method='cash', date=date(2026, 2, 1 + idx))
+        Income.objects.create(barber=self.barber, amount=999, payment_method='cash', date=date(2026, 3, 1))
+
+        with mock.patch('barber.views.paginate', wraps=self._small_pages):
+            response = self.client.get(reverse('income_list'), {'date_from': '2026-02-01', 'date_to': '2026-02-28'})
+            self.assertEqual(response.context['total'], 500)
+            self.assertEqual(response.context['record_count'], 5)
+            self.assertEqual(len(response.context['income_records']), 2)
+            page = response.context['page']
+            self.assertContains(response, 'date_from=2026-02-01&amp;date_to=2026-02-28&amp;cursor=')
+
+            response = self.client.get(reverse('income_list'), {'date_from': '2026-02-01', 'date_to': '2026-02-28', 'cursor': page.next_cursor})
+            self.assertEqual([i.date.day for i in response.context['income_records']], [3, 2])
+
+    def test_bookings_and_clients_lists_paginate(self):
+        for idx in range(3):
+            Booking.objects.create(barber=self.barber, client_name=f'Walk {idx}', status='completed', queue_position=idx + 1)
+        with mock.patch('barber.views.paginate', wraps=self._small_pages):
+            response = self.client.get(reverse('bookings_list'), {'status': 'completed'})
+        self.assertEqual([b.client_name for b in response.context['bookings']], ['Walk 0', 'Walk 1'])
+        self.assertTrue(response.context['page'].has_next)
+
+        response = self.client.get(reverse('clients_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['client_count'], 0)
+
+
+# ==== EXPORT TESTS ====
+
+class TestCsvExport(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='export_barber', password='testpass123')
+        self.service = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.sam = Client.objects.create(barber=self.barber, name='Sam', surname='Lee', phone='0820000001', age_group='adult', gender='male')
+        self.client = DjangoTestClient()
+        self.client.login(username='export_barber', password='testpass123')
+
+    def _read(self, response):
+        import csv
+        import io
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_income_export_streams_month(self):
+        Income.objects.create(barber=self.barber, client=self.sam, service=self.service, amount=100, payment_method='credit', date=date(2026, 3, 5))
+        Income.objects.create(barber=self.barber, client_name='=HYPERLINK("x")', amount=50, payment_method='cash', is_walkin=True, date=date(2026, 3, 9))
+        Income.objects.create(barber=self.barber, amount=70, payment_method='cash', date=date(2026, 4, 1))
+
+        response = self.client.get(reverse('export_income_csv'), {'month': '2026-03'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="income_2026-03.csv"')
+        rows = self._read(response)
+        self.assertEqual(rows[0][:5], ['Date', 'Client', 'Phone', 'Service', 'Amount'])
+        self.assertEqual(rows[1], ['2026-03-05', 'Sam Lee', '0820000001', 'Haircut', '100.00', 'Credit', 'No', 'No', ''])
+        self.assertEqual(rows[2][1], '\'=HYPERLINK("x")')
+        self.assertEqual(len(rows), 3)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        from django.test import AsyncClient
+
+        for day in range(1, 6):
+            await Income.objects.acreate(barber=self.barber, amount=100, payment_method='cash', date=date(2026, 3, day))
+        client = AsyncClient()
+        await client.aforce_login(self.barber)
+        response = await client.get(reverse('export_income_csv'), {'month': '2026-03'})
+        # An async iterator is sent as it is produced instead of being collected into a list
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(content.count('\n'), 6)
+
+    def test_stream_in_thread_yields_chunks_of_lines(self):
+        from asgiref.sync import async_to_sync
+        from barber.exports import stream_in_thread
+
+        async def collect():
+            return [chunk async for chunk in stream_in_thread(iter(['a\n', 'b\n', 'c\n']), chunk_lines=2)]
+
+        self.assertEqual(async_to_sync(collect)(), ['a\nb\n', 'c\n'])
+
+    def test_export_queries_do_not_grow_with_rows(self):
+        from barber.exports import income_rows
+
+        for idx in range(20):
+            Income.objects.create(barber=self.barber, client=self.sam, service=self.service, amount=100, payment_method='cash', date=date(2026, 3, 1))
+        with self.assertNumQueries(1):
+            rows = list(income_rows(self.barber))
+        self.assertEqual(len(rows), 20)
+
+    def test_booking_export_year(self):
+        Booking.objects.create(
+            barber=self.barber, client=self.sam, service=self.service, status='completed',
+            appointment_date=date(2025, 6, 1), appointment_time=time(10, 0)
+        )
+        Booking.objects.create(
+            barber=self.barber, client_name='Old', status='completed',
+            appointment_date=date(2024, 6, 1), appointment_time=time(10, 0)
+        )
+        response = self.client.get(reverse('export_bookings_csv'), {'year': '2025'})
+        rows = self._read(response)
+        self.assertEqual([row[:6] for row in rows[1:]], [['2025-06-01', '10:00', 'Sam Lee', '0820000001', 'Haircut', 'Completed']])
+
+    def test_invalid_period_redirects(self):
+        response = self.client.get(reverse('export_income_csv'), {'month': 'March'})
+        self.assertRedirects(response, reverse('income_list'))
+
+    def test_export_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        Income.objects.create(barber=self.barber, client=self.sam, service=self.service, amount=100, payment_method='cash', date=date(2026, 3, 5))
+        out = StringIO()
+        call_command('export_csv', 'income', '--barber', 'export_barber', '--year', '2026', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('2026-03-05,Sam Lee'))
+
+
+# ==== IMPORT TESTS ====
+
+class TestCsvImport(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='import_barber', password='testpass123')
+        self.service = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        Client.objects.create(barber=self.barber, name='Sam', surname='Lee', phone='082 000 0001', age_group='adult', gender='male')
+
+    def _csv(self, text):
+        import io
+        return io.StringIO(text)
+
+    def test_import_clients_dedupes_and_reports_rows(self):
+        from barber.imports import import_clients
+
+        result = import_clients(self.barber, self._csv(
+            "Name,Surname,Phone,Age_Group,Gender\n"
+            "Jo,Ndlovu,083-000-0002,Adult,Female\n"
+            "Sam,Again,0820000001,adult,male\n"
+            "Kid,Dube,0840000003,toddler,male\n"
+            "Jo,Twice,083 000 0002,adult,female\n"
+            ",Blank,0850000004,adult,male\n"
+        ))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, message in result.errors], [3, 4, 5, 6])
+        self.assertIn('already exists', result.errors[0][1])
+        self.assertEqual(Client.objects.get(surname='Ndlovu').phone, '0830000002')
+
+    def test_import_clients_query_count_is_per_batch(self):
+        from barber.imports import import_clients
+
+        rows = ''.join(f"C{idx},S{idx},0710000{idx:03d},adult,male\n" for idx in range(250))
+        # One phone lookup, then savepoint, insert and release per batch
+        with self.assertNumQueries(1 + 3 * 3):
+            result = import_clients(self.barber, self._csv("name,surname,phone,age_group,gender\n" + rows), batch_size=100)
+        self.assertEqual(result.created, 250)
+
+    def test_import_income_rebuilds_rollup(self):
+        from barber.imports import import_income
+        from barber.models import DailyIncomeRollup
+
+        result = import_income(self.barber, self._csv(
+            "date,amount,payment_method,service,client_phone,credit_paid\n"
+            "2025-01-05,100,Cash,haircut,,\n"
+            "2025-01-05,100,credit,Haircut,0820000001,no\n"
+            "2025-01-06,1,eft,Beard,,\n"
+            "05/01/2025,100,cash,,,\n"
+        ))
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, message in result.errors], [4, 5])
+        credit = Income.objects.get(payment_method='credit')
+        self.assertEqual(credit.client.surname, 'Lee')
+        self.assertFalse(credit.is_walkin)
+
+        rollups = DailyIncomeRollup.objects.filter(barber=self.barber, date=date(2025, 1, 5))
+        self.assertEqual(sum(r.total for r in rollups), 200)
+        self.assertEqual(sum(r.credit_outstanding for r in rollups), 100)
+
+    def test_non_numeric_amounts_are_row_errors(self):
+        from barber.imports import import_income
+
+        result = import_income(self.barber, self._csv(
+            "date,amount,payment_method\n"
+            "2025-01-05,NaN,cash\n"
+            "2025-01-05,sNaN,cash\n"
+            "2025-01-05,-Infinity,cash\n"
+            "2025-01-05,80,cash\n"
+        ))
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, message in result.errors], [2, 3, 4])
+
+    def test_missing_column_is_reported(self):
+        from barber.imports import ImportRowError, import_income
+
+        with self.assertRaisesMessage(ImportRowError, 'Missing column(s): payment_method'):
+            import_income(self.barber, self._csv("date,amount\n2025-01-05,100\n"))
+
+    def test_upload_view(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        client = DjangoTestClient()
+        client.login(username='import_barber', password='testpass123')
+        upload = SimpleUploadedFile('clients.csv', b'\xef\xbb\xbfname,surname,phone,age_group,gender\nJo,Ndlovu,0830000002,adult,female\n')
+        response = client.post(reverse('import_csv'), {'kind': 'clients', 'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertTrue(Client.objects.filter(barber=self.barber, phone='0830000002').exists())
+
+    def test_import_command(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("date,amount,payment_method\n2025-02-01,80,cash\n")
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_csv', 'income', f.name, '--barber', 'import_barber', stdout=out)
+        self.assertIn('1 created, 0 skipped', out.getvalue())
+
+
+# ==== SMS OUTBOX TESTS ====
+
+def _accept_all(messages):
+    return [None] * len(messages)
+
+
+class TestSmsOutbox(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(username='sms_barber', password='testpass123')
+        self.service = Service.objects.create(barber=self.barber, name='Haircut', price=100, duration_minutes=30)
+        self.day = date.today() + timedelta(days=1)
+
+    def _book(self):
+        with mock.patch('barber.sms.wake_dispatcher') as wake:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = DjangoTestClient().post(reverse('public_booking', kwargs={'username': 'sms_barber'}), {
+                    'name': 'Outbox Client',
+                    'phone': '0831234567',
+                    'service': self.service.id,
+                    'appointment_date': self.day,
+                    'appointment_time': '10:00',
+                })
+        self.assertRedirects(response, reverse('booking_success'))
+        return wake
+
+    def test_booking_queues_confirmation_without_sending(self):
+        from barber.models import SmsOutbox
+
+        with mock.patch('barber.sms.deliver_batch') as deliver:
+            wake = self._book()
+        deliver.assert_not_called()
+        wake.assert_called_once()
+        entry = SmsOutbox.objects.get()
+        booking = Booking.objects.get(barber=self.barber)
+        self.assertEqual((entry.status, entry.kind, entry.booking), ('queued', 'confirmation', booking))
+        self.assertIn(booking.cancellation_token, entry.message)
+
+    def test_failed_booking_leaves_no_message(self):
+        from barber.models import SmsOutbox
+
+        self._book()
+        response = DjangoTestClient().post(reverse('public_booking', kwargs={'username': 'sms_barber'}), {
+            'name': 'Second Client',
+            'phone': '0839999999',
+            'service': self.service.id,
+            'appointment_date': self.day,
+            'appointment_time': '10:00',
+        })
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(SmsOutbox.objects.count(), 1)
+
+    def test_dispatch_sends_and_marks_booking(self):
+        from barber.models import SmsOutbox
+        from barber.sms import drain_outbox
+
+        self._book()
+        with mock.patch('barber.sms.deliver_batch', side_effect=_accept_all) as deliver:
+            handled = drain_outbox()
+        deliver.assert_called_once()
+        self.assertEqual([entry.status for entry in handled], ['sent'])
+        entry = SmsOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.lease_token), ('sent', 1, ''))
+        self.assertTrue(Booking.objects.get(barber=self.barber).sms_confirmation_sent)
+
+    def test_failures_back_off_then_fail(self):
+        from barber import sms
+        from barber.models import SmsOutbox
+
+        self._book()
+        with mock.patch('barber.sms.deliver_batch', side_effect=lambda messages: ['503: busy'] * len(messages)):
+            sms.dispatch_pending()
+            entry = SmsOutbox.objects.get()
+            self.assertEqual((entry.status, entry.attempts, entry.last_error), ('queued', 1, '503: busy'))
+            self.assertGreater(entry.next_attempt_at, timezone.now() + timedelta(seconds=sms.SMS_RETRY_BASE_SECONDS - 5))
+            self.assertEqual(sms.dispatch_pending(), [])
+
+            for attempt in range(2, sms.SMS_MAX_ATTEMPTS + 1):
+                SmsOutbox.objects.update(next_attempt_at=timezone.now())
+                sms.dispatch_pending()
+        entry.refresh_from_db()
+        self.assertEqual((entry.status, entry.attempts), ('failed', sms.SMS_MAX_ATTEMPTS))
+        self.assertFalse(Booking.objects.get(barber=self.barber).sms_confirmation_sent)
+        self.assertEqual(sms.retry_delay(2), sms.SMS_RETRY_BASE_SECONDS * 2)
+
+    def test_expired_lease_is_reclaimed(self):
+        from barber import sms
+        from barber.models import SmsOutbox
+
+        self._book()
+        claimed = sms.claim_messages()
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(sms.claim_messages(), [])
+
+        # The dispatcher died mid-send: once its lease runs out the message is sent again
+        SmsOutbox.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        with mock.patch('barber.sms.deliver_batch', side_effect=_accept_all):
+            handled = sms.dispatch_pending()
+        self.assertEqual([(entry.status, entry.attempts) for entry in handled], [('sent', 2)])
+
+        # The original owner's late result is ignored
+        sms._finish(claimed, ['timeout'], timezone.now())
+        self.assertEqual(SmsOutbox.objects.get().status, 'sent')
+
+    def test_dispatch_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        self._book()
+        out = StringIO()
+        with mock.patch('barber.sms.deliver_batch', side_effect=_accept_all):
+            call_command('dispatch_sms', stdout=out)
+        self.assertIn('Sent 1, retrying 0, failed 0', out.getvalue())
+
+
+# ==== SMS CLIENT TESTS ====
+
+class TestBulkSMSClient(TestCase):
+    def setUp(self):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.statuses = []
+        self.bodies = []
+        self.connections = 0
+        self.requests = []
+        test = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                test.connections += 1
+
+            def do_POST(self):
+                test.requests.append(self.rfile.read(int(self.headers['Content-Length'])))
+                status = test.statuses.pop(0) if test.statuses else 201
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                body = test.bodies.pop(0) if test.bodies else b'{}'
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def _client(self, **kwargs):
+        from barber.sms import BulkSMSClient
+
+        client = BulkSMSClient('user', 'secret', url=f'http://127.0.0.1:{self.server.server_port}/v1/messages', **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_messages_reuse_one_connection(self):
+        client = self._client()
+        for i in range(20):
+            client.send('0831234567', f'Message {i}')
+        self.assertEqual(len(self.requests), 20)
+        self.assertEqual(self.connections, 1)
+        self.assertIn(b'"+27831234567"', self.requests[0])
+        metrics = client.metrics.snapshot()
+        self.assertEqual((metrics['calls'], metrics['failures']), (20, 0))
+        self.assertIsNotNone(metrics['p95_ms'])
+
+    def test_retries_429_and_5xx(self):
+        from barber.sms import SmsDeliveryError
+
+        client = self._client(retries=2)
+        self.statuses = [429, 503]
+        client.send('0831234567', 'Retried')
+        self.assertEqual(len(self.requests), 3)
+
+        self.statuses = [500, 502, 503]
+        with self.assertRaisesMessage(SmsDeliveryError, '503'):
+            client.send('0831234567', 'Gives up')
+        self.assertEqual(client.metrics.snapshot()['failures'], 1)
+
+    def test_read_timeout_is_bounded(self):
+        import socket
+        from barber.sms import BulkSMSClient, SmsDeliveryError
+
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen()
+        self.addCleanup(listener.close)
+        client = BulkSMSClient('user', 'secret', read_timeout=0.2, url=f'http://127.0.0.1:{listener.getsockname()[1]}/')
+        self.addCleanup(client.close)
+        with self.assertRaises(SmsDeliveryError):
+            client.send('0831234567', 'Never answered')
+
+    def test_send_batch_maps_results_to_messages(self):
+        import json
+
+        client = self._client()
+        self.bodies = [json.dumps([
+            {'id': '1', 'status': {'type': 'ACCEPTED'}},
+            {'id': '2', 'status': {'type': 'FAILED', 'subtype': 'BLOCKED'}},
+            {'id': '3', 'status': {'type': 'ACCEPTED'}},
+        ]).encode()]
+        errors = client.send_batch([('0831111111', 'One'), ('0832222222', 'Two'), ('0833333333', 'Three')])
+        self.assertEqual(errors, [None, 'Rejected by gateway: BLOCKED', None])
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual([m['to'] for m in json.loads(self.requests[0])], ['+27831111111', '+27832222222', '+27833333333'])
+
+        self.statuses = [400]
+        self.assertEqual(client.send_batch([('0831111111', 'One'), ('0832222222', 'Two')]), ['400: {}', '400: {}'])
+
+
+class TestBatchedSms(TestCase):
+    def setUp(self):
+        self.barber = Barber.objects.create_user(username='batch_barber', password='testpass123')
+        self.bookings = Booking.objects.bulk_create([
+            Booking(
+                barber=self.barber, client_name=f'Client {i}', client_phone=f'08300{i:05d}',
+                appointment_date=date.today(), appointment_time=time(10, 0), status='pending',
+                queue_position=0, cancellation_token=f'batch-{i}',
+            )
+            for i in range(250)
+        ])
+
+    def test_dispatch_sends_in_gateway_batches(self):
+        from barber import sms
+        from barber.models import SmsOutbox
+
+        sms.queue_booking_reminders(self.bookings[:200], wake=False)
+        for booking in self.bookings[200:]:
+            sms.queue_sms(self.barber, booking.client_phone, 'Confirmed', booking=booking, kind='confirmation', wake=False)
+
+        calls = []
+
+        def gateway(messages):
+            calls.append(len(messages))
+            return ['Rejected by gateway: BLOCKED' if phone == '0830000007' else None for phone, message in messages]
+
+        with mock.patch('barber.sms.deliver_batch', side_effect=gateway):
+            # Claim (3), then in one savepoint: ownership check, sent rows, booking flags, one retry group
+            with self.assertNumQueries(9):
+                handled = sms.dispatch_pending(limit=250, batch_size=100)
+        self.assertEqual(sorted(calls), [50, 100, 100])
+        self.assertEqual(len(handled), 250)
+        self.assertEqual(SmsOutbox.objects.filter(status='sent').count(), 249)
+        self.assertEqual(SmsOutbox.objects.get(status='queued').phone, '0830000007')
+
+        bookings = Booking.objects.filter(barber=self.barber)
+        self.assertEqual(bookings.filter(sms_reminder_sent=True).count(), 199)
+        self.assertEqual(bookings.filter(sms_confirmation_sent=True).count(), 50)
+        self.assertFalse(bookings.filter(sms_reminder_sent=True, sms_confirmation_sent=True).exists())
+
+    def test_send_reminders_queues_and_sends_due_bookings(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        start = timezone.localtime() + timedelta(minutes=10)
+        Booking.objects.filter(pk__in=[b.pk for b in self.bookings[:30]]).update(
+            appointment_date=start.date(), appointment_time=start.time().replace(microsecond=0), appointment_start=start
+        )
+        with mock.patch('barber.sms.deliver_batch', side_effect=_accept_all) as deliver:
+            out = StringIO()
+            call_command('send_reminders', stdout=out)
+            call_command('send_reminders', stdout=StringIO())
+        self.assertEqual(deliver.call_count, 1)
+        self.assertIn('Total reminders sent: 30', out.getvalue())
+        self.assertEqual(Booking.objects.filter(sms_reminder_sent=True).count(), 30)
+
+
+# ==== REMINDER TESTS ====
+
+class TestDueReminders(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(username='remind_barber', password='testpass123')
+        self.quiet_barber = Barber.objects.create_user(
+            username='quiet_barber', password='testpass123', sms_notifications_enabled=False
+        )
+        self.now = timezone.now()
+
+    def _booking(self, barber, minutes, **kwargs):
+        start = timezone.localtime(self.now + timedelta(minutes=minutes))
+        defaults = {'status': 'pending', 'client_name': 'Due Client', 'client_phone': '0831234567'}
+        defaults.update(kwargs)
+        return Booking.objects.create(
+            barber=barber, appointment_date=start.date(), appointment_time=start.time(), **defaults
+        )
+
+    def test_selects_only_due_bookings_in_one_query(self):
+        from barber.reminders import due_reminders
+        from barber.sms import queue_booking_reminders
+
+        due = self._booking(self.barber, 10)
+        self._booking(self.barber, 10.5, status='confirmed')
+        self._booking(self.barber, 14)
+        self._booking(self.barber, 5)
+        self._booking(self.barber, 10, status='cancelled')
+        self._booking(self.barber, 10, sms_reminder_sent=True)
+        self._booking(self.quiet_barber, 10)
+        queue_booking_reminders([self._booking(self.barber, 9.5)], wake=False)
+
+        with self.assertNumQueries(1):
+            bookings = list(due_reminders(self.now))
+            phones = [booking.get_client_phone() for booking in bookings]
+            names = {booking.barber.username for booking in bookings}
+        self.assertEqual(len(bookings), 2)
+        self.assertIn(due, bookings)
+        self.assertEqual((phones, names), (['0831234567'] * 2, {'remind_barber'}))
+
+    def test_query_uses_reminder_index(self):
+        from django.db import connection
+        from barber.reminders import due_reminders
+
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan check is written for SQLite')
+        sql, params = due_reminders(self.now).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('booking_reminder_due_idx', plan)
+
+
+class TestReminderScheduler(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.barber = Barber.objects.create_user(username='scheduler_barber', password='testpass123')
+        self.now = timezone.now()
+
+    def _booking(self, minutes, **kwargs):
+        start = timezone.localtime(self.now + timedelta(minutes=minutes))
+        return Booking.objects.create(
+            barber=self.barber, appointment_date=start.date(), appointment_time=start.time(),
+            status='pending', client_name='Heap Client', client_phone='0831234567', **kwargs
+        )
+
+    def _scheduler(self):
+        from barber.reminders import ReminderScheduler
+        return ReminderScheduler(poll_seconds=3600)
+
+    def test_fires_each_reminder_when_due(self):
+        first = self._booking(10.5)
+        self._booking(25)
+        scheduler = self._scheduler()
+
+        self.assertEqual(scheduler.run_once(self.now), [])
+        self.assertEqual(len(scheduler), 2)
+        self.assertAlmostEqual(scheduler.seconds_until_next(self.now), 30, delta=1)
+
+        queued = scheduler.run_once(self.now + timedelta(seconds=31))
+        self.assertEqual([entry.booking_id for entry in queued], [first.pk])
+        self.assertEqual(queued[0].kind, 'reminder')
+        self.assertEqual(len(scheduler), 1)
+        self.assertAlmostEqual(scheduler.seconds_until_next(self.now + timedelta(seconds=31)), 15 * 60 - 31, delta=1)
+
+    def test_picks_up_new_and_cancelled_bookings(self):
+        cancelled = self._booking(12)
+        scheduler = self._scheduler()
+        scheduler.run_once(self.now)
+
+        added = self._booking(11)
+        cancelled.status = 'cancelled'
+        cancelled.save()
+        with self.assertNumQueries(3):
+            scheduler.poll_changes(self.now)
+        self.assertEqual(len(scheduler), 1)
+
+        queued = scheduler.run_once(self.now + timedelta(minutes=1, seconds=1))
+        self.assertEqual([entry.booking_id for entry in queued], [added.pk])
+
+    def test_only_one_instance_queues_a_reminder(self):
+        from barber.reminders import claim_reminders
+        from barber.models import SmsOutbox
+
+        booking = self._booking(10)
+        schedulers = [self._scheduler(), self._scheduler()]
+        queued = [scheduler.run_once(self.now + timedelta(seconds=1)) for scheduler in schedulers]
+        self.assertEqual([len(entries) for entries in queued], [1, 0])
+        self.assertEqual(SmsOutbox.objects.filter(booking=booking, kind='reminder').count(), 1)
+
+        # A booking leased by another instance is left to it
+        other = self._booking(10)
+        Booking.objects.filter(pk=other.pk).update(
+            reminder_lease_token='elsewhere', reminder_lease_expires_at=self.now + timedelta(seconds=10)
+        )
+        self.assertEqual(claim_reminders([other.pk], self.now), [])
+        self.assertEqual(len(claim_reminders([other.pk], self.now + timedelta(seconds=20))), 1)
@@ -16,6 +16,10 @@ urlpatterns = [
     # Queue management
     path('queue/start/<int:booking_id>/', views.start_service_from_queue, name='start_service_from_queue'),
     path('queue/remove/<int:booking_id>/', views.remove_from_queue, name='remove_from_queue'),
+    path('queue/move/<int:booking_id>/<str:direction>/', views.move_in_queue, name='move_in_queue'),
+    path('queue/promote/', views.promote_appointments, name='promote_appointments'),
+    path('queue/events/', views.queue_events, name='queue_events'),
+    path('queue/snapshot/', views.queue_snapshot, name='queue_snapshot'),
     
     # Quick start workflow
     path('client/new/', views.client_create, name='client_create'),
@@ -37,12 +41,15 @@ urlpatterns = [
     path('bookings/create/', views.booking_create, name='booking_create'),
     path('bookings/<int:pk>/start/', views.booking_start, name='booking_start'),
     path('bookings/<int:pk>/complete/', views.booking_complete, name='booking_complete'),
+    path('bookings/export/', views.export_csv, {'kind': 'bookings'}, name='export_bookings_csv'),
     
     # Income
     path('income/', views.income_list, name='income_list'),
     path('income/create/', views.income_create, name='income_create'),
     path('income/credit/', views.credit_list, name='credit_list'),
     path('income/credit/<int:income_id>/paid/', views.mark_credit_paid, name='mark_credit_paid'),
+    path('income/export/', views.export_csv, {'kind': 'income'}, name='export_income_csv'),
+    path('import/', views.import_csv, name='import_csv'),
     
     # Settings
     path('settings/', views.settings_view, name='settings'),
@@ -53,5 +60,7 @@ urlpatterns = [
     path('cancel/<str:token>/', views.booking_cancel, name='booking_cancel'),
     path('booking/cancelled/', views.booking_cancelled, name='booking_cancelled'),
     path('book/<str:username>/get_slots/', views.get_available_slots_ajax, name='get_available_slots_ajax'),
+    path('book/<str:username>/calendar/', views.get_availability_calendar_ajax, name='get_availability_calendar_ajax'),
+    path('book/<str:username>/hold/', views.hold_slot_ajax, name='hold_slot_ajax'),
     path('booking/success/', views.booking_success, name='booking_success'),
 ]
\ No newline at end of file
@@ -2,19 +2,42 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
+from django.db.models import Sum
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from datetime import datetime, timedelta, date
+import asyncio
+import io
+import json
 import uuid
-from .models import Barber, Service, Client, Booking, Income, RegistrationRequest
+from .models import Barber, Service, Client, Booking, Income, DailyIncomeRollup, RegistrationRequest
 from .forms import (
     BarberRegistrationForm, ServiceForm, ClientForm, 
-    BookingForm, IncomeForm, SettingsForm, PublicBookingForm
+    BookingForm, IncomeForm, SettingsForm, PublicBookingForm, ImportForm
 )
-from .sms import send_sms, send_booking_confirmation, send_booking_reminder
-from django.db import models
-
+from .sms import queue_booking_confirmation
+from . import queue as queue_ops
+from .events import get_broker, get_queue_version, is_asgi_request, serialize_booking
+from .availability import get_available_slots, get_available_days, hold_slot, reserve_booking, HoldLimitReached, SlotUnavailable
+from .waittimes import estimate_wait_times, record_service_duration
+from .dashboard import get_dashboard_stats, get_cached_month_summary
+from .receivables import get_credit_ledger, get_receivables
+from .pagination import paginate, page_query
+from .exports import EXPORTS, period_bounds, stream_csv, stream_in_thread
+from .imports import IMPORTS, ImportRowError
+from django.db import models, transaction
+from django.views.decorators.http import condition
+
+# Keyset orderings for the paginated lists, each ending in a unique column
+INCOME_LIST_ORDERING = ['-date', '-created_at', '-pk']
+BOOKING_LIST_ORDERING = ['queue_position', 'added_to_queue_at', 'pk']
+CLIENT_LIST_ORDERING = ['surname', 'name', 'pk']
+
+# Row errors listed on the import page, the rest are only counted
+IMPORT_ERRORS_SHOWN = 100
+
+# Session key of the visitor's live slot hold; a new hold replaces it
+SLOT_HOLD_SESSION_KEY = 'slot_hold_token'
 
 
 @login_required
@@ -22,48 +45,9 @@ def dashboard(request):
     """Main dashboard view with stats"""
     barber = request.user
     today = timezone.now().date()
-    week_start = today - timedelta(days=today.weekday())
-    month_start = today.replace(day=1)
-
-    # Income totals for current periods
-    daily_income = Income.objects.filter(barber=barber, date=today).aggregate(total=Sum('amount'))['total'] or 0
-    weekly_income = Income.objects.filter(barber=barber, date__gte=week_start).aggregate(total=Sum('amount'))['total'] or 0
-    monthly_income = Income.objects.filter(barber=barber, date__gte=month_start).aggregate(total=Sum('amount'))['total'] or 0
-
-    # Service counters for current periods
-    daily_services = Income.objects.filter(barber=barber, date=today).values('service__name').annotate(count=Count('id'))
-    weekly_services = Income.objects.filter(barber=barber, date__gte=week_start).values('service__name').annotate(count=Count('id'))
-    monthly_services = Income.objects.filter(barber=barber, date__gte=month_start).values('service__name').annotate(count=Count('id'))
 
-    # Calculate income for the previous 6 months (for the chart)
-    current_month_start = today.replace(day=1)
-    six_months_ago = current_month_start - timedelta(days=30*6)
-    six_months_ago_start = six_months_ago.replace(day=1)
-
-    monthly_income_last_6 = Income.objects.filter(
-        barber=barber,
-        date__gte=six_months_ago_start,
-        date__lt=current_month_start + timedelta(days=32)
-    ).extra(
-        select={'month': "strftime('%%Y-%%m', date)"}
-    ).values('month').annotate(
-        total=Sum('amount')
-    ).order_by('month')
-
-    import calendar
-    chart_labels = []
-    chart_data = []
-    current_iter_month = six_months_ago_start.replace(day=1)
-    income_dict = {item['month']: float(item['total']) for item in monthly_income_last_6}
-
-    while current_iter_month < current_month_start + timedelta(days=31):
-        month_key = current_iter_month.strftime('%Y-%m')
-        chart_labels.append(calendar.month_abbr[current_iter_month.month] + " " + current_iter_month.strftime('%y'))
-        chart_data.append(income_dict.get(month_key, 0))
-        if current_iter_month.month == 12:
-            current_iter_month = current_iter_month.replace(year=current_iter_month.year + 1, month=1)
-        else:
-            current_iter_month = current_iter_month.replace(month=current_iter_month.month + 1)
+    # Stat cards and chart, cached until an income record for this barber changes
+    dashboard_stats = get_dashboard_stats(barber, today)
 
     # --- New Logic for Specific Month Selection ---
     selected_month_str = request.GET.get('month', '') # Get the month from query parameters
@@ -89,11 +73,10 @@ def dashboard(request):
                 date__lte=selected_month_end
             ).select_related('client', 'service').order_by('-date', '-created_at')
 
-            # Calculate total income for the selected month
-            selected_month_income = selected_month_transactions.aggregate(total=Sum('amount'))['total'] or 0
-
-            # Calculate service counts for the selected month
-            selected_month_services = selected_month_transactions.values('service__name').annotate(count=Count('id'))
+            # Total and service counts for the month come from the daily rollup, cached per month
+            selected_month_income, selected_month_services = get_cached_month_summary(
+                barber, selected_month_start, selected_month_end, today
+            )
 
         except ValueError:
             # Handle invalid month string format gracefully
@@ -104,15 +87,8 @@ def dashboard(request):
     today_completed = Income.objects.filter(barber=barber, date=today).select_related('client', 'service')
 
     context = {
-        'daily_income': daily_income,
-        'weekly_income': weekly_income,
-        'monthly_income': monthly_income,
-        'daily_services': daily_services,
-        'weekly_services': weekly_services,
-        'monthly_services': monthly_services,
+        **dashboard_stats,
         'today_completed': today_completed,
-        'chart_labels': chart_labels[-6:],
-        'chart_data': chart_data[-6:],
         # Add new context variables for selected month
         'selected_month_str': selected_month_str,
         'selected_month_income': selected_month_income,
@@ -126,43 +102,30 @@ def dashboard(request):
 def home(request):
     """Home page with queue and quick start buttons"""
     barber = request.user
-    today = timezone.now().date()
-    now = timezone.now()
     
     # Get active service (in progress)
     active_booking = Booking.objects.filter(
         barber=barber,
         status='in_progress',
         timer_started_at__isnull=False
-    ).first()
+    ).select_related('client', 'service').first()
     
     # Get queue - all waiting clients
-    queue = Booking.objects.filter(
-        barber=barber,
-        status='waiting'
-    ).order_by('queue_position', 'added_to_queue_at')
-    
-    # Add appointments that have reached their time to the queue
-    pending_appointments = Booking.objects.filter(
-        barber=barber,
-        status__in=['pending', 'confirmed'],
-        appointment_date=today,
-        appointment_time__lte=now.time()
-    )
+    # Due appointments are promoted by the promote_appointments command or the refresh button
+    queue = list(queue_ops.get_waiting_queue(barber).select_related('client', 'service'))
     
-    for appt in pending_appointments:
-        appt.status = 'waiting'
-        appt.save()
-    
-    # Refresh queue after adding appointments
-    queue = Booking.objects.filter(
-        barber=barber,
-        status='waiting'
-    ).order_by('queue_position', 'added_to_queue_at')
+    # Projected minutes until each client is seen, from precomputed duration stats
+    wait_times = estimate_wait_times(barber, active_booking, queue)
+    if active_booking:
+        active_booking.estimated_minutes_left = wait_times[active_booking.pk]
+    for booking in queue:
+        booking.estimated_wait_minutes = wait_times[booking.pk]
     
     context = {
         'active_booking': active_booking,
         'queue': queue,
+        # The event stream only works when served through ASGI
+        'live_updates': is_asgi_request(request),
     }
     
     return render(request, 'barber/home.html', context)
@@ -245,9 +208,16 @@ def service_delete(request, pk):
 
 @login_required
 def clients_list(request):
-    """List all clients"""
+    """List all clients, a page at a time"""
     clients = Client.objects.filter(barber=request.user)
-    return render(request, 'barber/clients_list.html', {'clients': clients})
+    page = paginate(clients, CLIENT_LIST_ORDERING, request.GET.get('cursor'))
+    context = {
+        'clients': page,
+        'page': page,
+        'page_query': page_query(request),
+        'client_count': clients.count(),
+    }
+    return render(request, 'barber/clients_list.html', context)
 
 
 @login_required
@@ -316,7 +286,13 @@ def bookings_list(request):
     if date_filter:
         bookings = bookings.filter(appointment_date=date_filter)
     
-    return render(request, 'barber/bookings_list.html', {'bookings': bookings})
+    page = paginate(bookings.select_related('client', 'service'), BOOKING_LIST_ORDERING, request.GET.get('cursor'))
+    context = {
+        'bookings': page,
+        'page': page,
+        'page_query': page_query(request),
+    }
+    return render(request, 'barber/bookings_list.html', context)
 
 
 @login_required
@@ -380,6 +356,7 @@ def booking_complete(request, pk):
         booking.status = 'completed'
         booking.timer_ended_at = timezone.now()
         booking.save()
+        record_service_duration(booking)
         
         messages.success(request, f'Service completed! R{booking.service.price} recorded.')
         return redirect('home')
@@ -461,20 +438,110 @@ def remove_from_queue(request, booking_id):
     booking = get_object_or_404(Booking, pk=booking_id, barber=request.user, status='waiting')
     
     client_name = booking.get_client_name()
-    booking.status = 'removed'
-    booking.save()
+    queue_ops.remove_from_queue(booking)
     
-    # Reorder queue
-    remaining_queue = Booking.objects.filter(
-        barber=request.user,
-        status='waiting'
-    ).order_by('queue_position', 'added_to_queue_at')
+    messages.success(request, f'{client_name} removed from queue!')
+    return redirect('home')
+
+
+# Seconds between keep-alive comments on an idle event stream
+QUEUE_EVENTS_KEEPALIVE = 15
+
+
+@login_required
+async def queue_events(request):
+    """Server-sent event stream of queue and timer changes for the logged in barber (needs ASGI)"""
+    if not is_asgi_request(request):
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    user = await request.auser()
+
+    async def stream():
+        subscription = get_broker().subscribe(user.pk)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(timeout=QUEUE_EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            get_broker().unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _queue_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return f"queue-{request.user.pk}-{get_queue_version(request.user.pk)}"
+
+
+@login_required
+@condition(etag_func=_queue_etag)
+def queue_snapshot(request):
+    """
+    Compact JSON view of the queue for displays that poll.
+    Answers 304 Not Modified from the queue version alone when nothing changed.
+    Wait estimates are as of generated_at; clients subtract the time since then.
+    """
+    barber = request.user
+    active_booking = Booking.objects.filter(
+        barber=barber,
+        status='in_progress',
+        timer_started_at__isnull=False
+    ).select_related('client', 'service').first()
+    queue = list(queue_ops.get_waiting_queue(barber).select_related('client', 'service'))
+    now = timezone.now()
+    wait_times = estimate_wait_times(barber, active_booking, queue, now)
+
+    waiting = []
+    for position, booking in enumerate(queue, start=1):
+        waiting.append({
+            **serialize_booking(booking),
+            'position': position,
+            'is_walkin': booking.is_walkin,
+            'estimated_wait_minutes': wait_times[booking.pk],
+        })
+
+    active = None
+    if active_booking:
+        active = {**serialize_booking(active_booking), 'estimated_minutes_left': wait_times[active_booking.pk]}
+
+    response = JsonResponse({
+        'active_booking': active,
+        'queue': waiting,
+        'generated_at': now.isoformat(),
+    })
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+def promote_appointments(request):
+    """Move appointments that have reached their time into the queue"""
+    if request.method == 'POST':
+        promoted = queue_ops.promote_due_appointments(barber=request.user)
+        if promoted:
+            messages.success(request, f'{len(promoted)} appointment(s) added to queue!')
+    return redirect('home')
+
+
+@login_required
+def move_in_queue(request, booking_id, direction):
+    """Move person one place up or down the queue"""
+    booking = get_object_or_404(Booking, pk=booking_id, barber=request.user, status='waiting')
     
-    for idx, item in enumerate(remaining_queue, start=1):
-        item.queue_position = idx
-        item.save()
+    if direction not in ('up', 'down'):
+        messages.error(request, 'Invalid queue direction!')
+        return redirect('home')
     
-    messages.success(request, f'{client_name} removed from queue!')
+    queue_ops.move_in_queue(booking, -1 if direction == 'up' else 1)
     return redirect('home')
 
 
@@ -485,17 +552,27 @@ def income_list(request):
     date_to = request.GET.get('date_to', '')
     
     income_records = Income.objects.filter(barber=request.user)
+    rollups = DailyIncomeRollup.objects.filter(barber=request.user)
     
     if date_from:
         income_records = income_records.filter(date__gte=date_from)
+        rollups = rollups.filter(date__gte=date_from)
     if date_to:
         income_records = income_records.filter(date__lte=date_to)
+        rollups = rollups.filter(date__lte=date_to)
     
-    total = income_records.aggregate(total=Sum('amount'))['total'] or 0
+    # Totals come from the daily rollup, so they cost one row per day rather than per record
+    totals = rollups.aggregate(total=Sum('total'), record_count=Sum('count'))
+    page = paginate(income_records.select_related('client', 'service'), INCOME_LIST_ORDERING, request.GET.get('cursor'))
     
     context = {
-        'income_records': income_records,
-        'total': total,
+        'income_records': page,
+        'page': page,
+        'page_query': page_query(request),
+        'total': totals['total'] or 0,
+        'record_count': totals['record_count'] or 0,
+        'date_from': date_from,
+        'date_to': date_to,
     }
     
     return render(request, 'barber/income_list.html', context)
@@ -503,63 +580,79 @@ def income_list(request):
 
 @login_required
 def credit_list(request):
-    """List all clients who used credit this month"""
+    """Outstanding credit across all months, with this month's paid credit"""
     today = timezone.now().date()
     month_start = today.replace(day=1)
     
-    # Get all credit transactions for this month (both paid and unpaid)
-    credit_transactions = Income.objects.filter(
-        barber=request.user,
-        payment_method='credit',
-        date__gte=month_start
-    ).select_related('client', 'service').order_by('credit_paid', '-date')
-    
-    # Calculate total credit owed per client (ONLY unpaid transactions)
-    from django.db.models import Sum
-    credit_summary = Income.objects.filter(
-        barber=request.user,
-        payment_method='credit',
-        credit_paid=False,
-        date__gte=month_start
-    ).values('client', 'client__name', 'client__surname', 'client__phone').annotate(
-        total_owed=Sum('amount'),
-        unpaid_count=Count('id')  # Only count unpaid transactions
-    ).order_by('-total_owed')
-    
-    # Total outstanding credit (only unpaid)
-    total_credit = Income.objects.filter(
-        barber=request.user,
-        payment_method='credit',
-        credit_paid=False,
-        date__gte=month_start
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Count paid and unpaid separately
-    paid_count = Income.objects.filter(
-        barber=request.user,
-        payment_method='credit',
-        credit_paid=True,
-        date__gte=month_start
-    ).count()
+    # Unpaid transactions from any month plus this month's paid ones, with running balances
+    credit_transactions = get_credit_ledger(request.user, today)
     
-    unpaid_count = Income.objects.filter(
-        barber=request.user,
-        payment_method='credit',
-        credit_paid=False,
-        date__gte=month_start
-    ).count()
+    # Per-client owed amounts, aging buckets and the page totals in one grouped query
+    credit_summary, credit_totals = get_receivables(request.user, today)
     
     context = {
         'credit_transactions': credit_transactions,
         'credit_summary': credit_summary,
-        'total_credit': total_credit,
         'month_start': month_start,
-        'paid_count': paid_count,
-        'unpaid_count': unpaid_count,
+        **credit_totals,
     }
     
     return render(request, 'barber/credit_list.html', context)
 
+
+@login_required
+def export_csv(request, kind):
+    """Stream income or booking history as CSV for a month, year or date range"""
+    list_view = 'income_list' if kind == 'income' else 'bookings_list'
+    try:
+        date_from, date_to = period_bounds(
+            month=request.GET.get('month'),
+            year=request.GET.get('year'),
+            date_from=request.GET.get('date_from'),
+            date_to=request.GET.get('date_to'),
+        )
+    except ValueError:
+        messages.error(request, 'Invalid export period. Use YYYY-MM, YYYY or YYYY-MM-DD dates.')
+        return redirect(list_view)
+    
+    header, rows = EXPORTS[kind]
+    # Rows are read in chunks and sent as they are written, the file is never built in memory
+    content = stream_csv(header, rows(request.user, date_from, date_to))
+    if is_asgi_request(request):
+        content = stream_in_thread(content)
+    response = StreamingHttpResponse(content, content_type='text/csv')
+    period = request.GET.get('month') or request.GET.get('year') or '-'.join(
+        d.isoformat() for d in (date_from, date_to) if d
+    ) or 'all'
+    response['Content-Disposition'] = f'attachment; filename="{kind}_{period}.csv"'
+    return response
+
+@login_required
+def import_csv(request):
+    """Bulk import clients or historical income from an uploaded CSV"""
+    result = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            kind = form.cleaned_data['kind']
+            # Decode the upload as a stream, rows are parsed and written in batches
+            csv_file = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = IMPORTS[kind](request.user, csv_file)
+            except (ImportRowError, UnicodeDecodeError) as e:
+                messages.error(request, f'Could not import file: {e}')
+            else:
+                messages.success(request, f'Import finished: {result}.')
+    else:
+        form = ImportForm()
+    
+    context = {
+        'form': form,
+        'result': result,
+        'errors': result.errors[:IMPORT_ERRORS_SHOWN] if result else [],
+    }
+    return render(request, 'barber/import.html', context)
+
 @login_required
 def income_create(request):
     """Record income (for walk-ins without booking)"""
@@ -600,6 +693,7 @@ def public_booking(request, username):
     """Public booking page for clients"""
     barber = get_object_or_404(Barber, username=username)
     services = Service.objects.filter(barber=barber)
+    status = 200
     
     if request.method == 'POST':
         form = PublicBookingForm(request.POST, barber=barber)
@@ -609,30 +703,37 @@ def public_booking(request, username):
             booking.status = 'pending'
             booking.cancellation_token = str(uuid.uuid4())
             
-            # Get or create client
-            client, created = Client.objects.get_or_create(
-                barber=barber,
-                phone=form.cleaned_data['phone'],
-                defaults={
-                    'name': form.cleaned_data['name'].split()[0],
-                    'surname': ' '.join(form.cleaned_data['name'].split()[1:]) if len(form.cleaned_data['name'].split()) > 1 else '',
-                    'age_group': 'adult',
-                    'gender': 'other',
-                }
-            )
-            
-            booking.client = client
-            booking.client_name = form.cleaned_data['name']
-            booking.client_phone = form.cleaned_data['phone']
-            
-            booking.save()
-            
-            # Send SMS confirmation
-            if barber.sms_notifications_enabled:
-                send_booking_confirmation(booking)
-            
-            messages.success(request, 'Booking created successfully! You will receive a confirmation SMS.')
-            return redirect('booking_success')
+            try:
+                with transaction.atomic():
+                    # Get or create client
+                    client, created = Client.objects.get_or_create(
+                        barber=barber,
+                        phone=form.cleaned_data['phone'],
+                        defaults={
+                            'name': form.cleaned_data['name'].split()[0],
+                            'surname': ' '.join(form.cleaned_data['name'].split()[1:]) if len(form.cleaned_data['name'].split()) > 1 else '',
+                            'age_group': 'adult',
+                            'gender': 'other',
+                        }
+                    )
+
+                    booking.client = client
+                    booking.client_name = form.cleaned_data['name']
+                    booking.client_phone = form.cleaned_data['phone']
+
+                    # Checks for overlaps and saves under the barber/day lock
+                    reserve_booking(booking, hold_token=request.session.get(SLOT_HOLD_SESSION_KEY))
+
+                    # Queued with the booking, sent by the SMS dispatcher after commit
+                    if barber.sms_notifications_enabled:
+                        queue_booking_confirmation(booking)
+            except SlotUnavailable:
+                messages.error(request, 'Sorry, that time slot was just taken. Please choose another time.')
+                status = 409
+            else:
+                request.session.pop(SLOT_HOLD_SESSION_KEY, None)
+                messages.success(request, 'Booking created successfully! You will receive a confirmation SMS.')
+                return redirect('booking_success')
     else:
         form = PublicBookingForm(barber=barber)
     
@@ -646,29 +747,8 @@ def public_booking(request, username):
             date_obj = datetime.strptime(selected_date, '%Y-%m-%d').date()
             service = Service.objects.get(pk=selected_service_id, barber=barber)
             
-            # Generate time slots
-            current_time = datetime.combine(date_obj, barber.work_start_time)
-            end_time = datetime.combine(date_obj, barber.work_end_time)
-            
-            while current_time < end_time:
-                slot_time = current_time.time()
-                
-                # Check if slot is available
-                slot_end = current_time + timedelta(minutes=service.duration_minutes)
-                
-                overlapping = Booking.objects.filter(
-                    barber=barber,
-                    appointment_date=date_obj,
-                    status__in=['pending', 'confirmed', 'in_progress']
-                ).exclude(appointment_time__gte=slot_end.time()).exclude(
-                    appointment_time__lte=slot_time
-                )
-                
-                if not overlapping.exists():
-                    available_slots.append(slot_time.strftime('%H:%M'))
-                
-                current_time += timedelta(minutes=30)  # 30-minute increments
-        except:
+            available_slots = get_available_slots(barber, date_obj, service)
+        except (ValueError, Service.DoesNotExist):
             pass
     
     context = {
@@ -678,7 +758,7 @@ def public_booking(request, username):
         'available_slots': available_slots,
     }
     
-    return render(request, 'barber/public_booking.html', context)
+    return render(request, 'barber/public_booking.html', context, status=status)
 
 
 def booking_success(request):
@@ -719,12 +799,6 @@ def mark_credit_paid(request, income_id):
 
 def get_available_slots_ajax(request, username):
     """AJAX view to return available time slots for a given date and service."""
-    from django.http import JsonResponse
-    from django.shortcuts import get_object_or_404
-    from django.utils import timezone
-    from datetime import datetime, timedelta
-    from .models import Barber, Service, Booking
-
     # Get the barber
     barber = get_object_or_404(Barber, username=username)
 
@@ -739,33 +813,73 @@ def get_available_slots_ajax(request, username):
             date_obj = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
             service = Service.objects.get(pk=selected_service_id, barber=barber)
 
-            # Generate time slots (similar logic to public_booking)
-            current_time = datetime.combine(date_obj, barber.work_start_time)
-            end_time = datetime.combine(date_obj, barber.work_end_time)
+            available_slots = get_available_slots(barber, date_obj, service)
+        except (ValueError, Service.DoesNotExist):
+            # Handle invalid date format or service not found
+            pass
+
+    # Return JSON response
+    return JsonResponse({'available_slots': available_slots})
 
-            while current_time.time() < end_time.time():
-                slot_time = current_time.time()
-                slot_end = current_time + timedelta(minutes=service.duration_minutes)
 
-                # Check for overlapping bookings
-                overlapping = Booking.objects.filter(
-                    barber=barber,
-                    appointment_date=date_obj,
-                    status__in=['pending', 'confirmed', 'in_progress']
-                ).exclude(appointment_time__gte=slot_end.time()).exclude(
-                    appointment_time__lt=slot_time # Changed from <= to < for inclusivity check
-                )
+def hold_slot_ajax(request, username):
+    """AJAX view to hold a time slot while the client completes the booking form."""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
 
-                if not overlapping.exists():
-                    available_slots.append(slot_time.strftime('%H:%M'))
+    barber = get_object_or_404(Barber, username=username)
 
-                current_time += timedelta(minutes=30)  # 30-minute increments
+    try:
+        date_obj = datetime.strptime(request.POST.get('date', ''), '%Y-%m-%d').date()
+        time_obj = datetime.strptime(request.POST.get('time', ''), '%H:%M').time()
+        service = Service.objects.get(pk=request.POST.get('service'), barber=barber)
+    except (ValueError, Service.DoesNotExist):
+        return JsonResponse({'error': 'Invalid date, time or service'}, status=400)
+
+    # One live hold per visitor: a new hold releases the previous one
+    try:
+        hold = hold_slot(
+            barber, service, date_obj, time_obj,
+            replace_token=request.session.get(SLOT_HOLD_SESSION_KEY),
+            client_ip=request.META.get('REMOTE_ADDR') or None,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'That time cannot be booked.'}, status=400)
+    except HoldLimitReached:
+        return JsonResponse({'error': 'Too many time slots are being held right now, please try again shortly.'}, status=429)
+    except SlotUnavailable:
+        return JsonResponse({'error': 'Sorry, that time slot was just taken.'}, status=409)
+
+    request.session[SLOT_HOLD_SESSION_KEY] = hold.token
+    return JsonResponse({'token': hold.token, 'expires_at': hold.expires_at.isoformat()}, status=201)
+
+
+def get_availability_calendar_ajax(request, username):
+    """AJAX view to return available time slots for the whole booking window."""
+    barber = get_object_or_404(Barber, username=username)
+    selected_service_id = request.GET.get('service')
+
+    days = []
+    next_available = None
+
+    if selected_service_id:
+        try:
+            service = Service.objects.get(pk=selected_service_id, barber=barber)
+            available_days = get_available_days(barber, service, timezone.localdate())
+
+            for day, slots in available_days.items():
+                days.append({
+                    'date': day.strftime('%Y-%m-%d'),
+                    'available_slots': slots,
+                    'full': not slots,
+                })
+                if slots and next_available is None:
+                    next_available = {'date': day.strftime('%Y-%m-%d'), 'time': slots[0]}
         except (ValueError, Service.DoesNotExist):
-            # Handle invalid date format or service not found
+            # Handle invalid service id
             pass
 
-    # Return JSON response
-    return JsonResponse({'available_slots': available_slots})
+    return JsonResponse({'days': days, 'next_available': next_available})
 
 
 def register(request):
@@ -0,0 +1,135 @@
+import math
+from django.db import transaction
+from django.utils import timezone
+from .models import Booking, ServiceDurationStats
+
+# Number of most recent completed services the statistics are computed over
+ROLLING_WINDOW = 50
+
+# Durations outside this range (in minutes) are treated as a forgotten timer and ignored
+MIN_SAMPLE_MINUTES = 1
+MAX_SAMPLE_MINUTES = 8 * 60
+
+# Used when a barber has no history for the service at all
+DEFAULT_SERVICE_MINUTES = Booking.DEFAULT_DURATION_MINUTES
+
+
+def percentile(sorted_values, pct):
+    """Linearly interpolated percentile (0-100) of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return float(sorted_values[lower])
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (rank - lower)
+
+
+def booking_duration_minutes(booking):
+    """Actual minutes a completed booking took, or None if it is not a usable sample"""
+    if not booking.timer_started_at or not booking.timer_ended_at:
+        return None
+    minutes = (booking.timer_ended_at - booking.timer_started_at).total_seconds() / 60
+    if not MIN_SAMPLE_MINUTES <= minutes <= MAX_SAMPLE_MINUTES:
+        return None
+    return round(minutes, 2)
+
+
+def _apply_samples(stats, samples):
+    """Add samples to the rolling window and refresh the summary numbers"""
+    stats.recent_minutes = (stats.recent_minutes + samples)[-ROLLING_WINDOW:]
+    stats.sample_count += len(samples)
+    ordered = sorted(stats.recent_minutes)
+    stats.median_minutes = percentile(ordered, 50)
+    stats.p90_minutes = percentile(ordered, 90)
+
+
+def record_service_duration(booking):
+    """
+    Fold one completed booking into the barber's per-service and overall stats.
+    Only the rolling window is touched, never the full history.
+    """
+    minutes = booking_duration_minutes(booking)
+    if minutes is None:
+        return
+
+    with transaction.atomic():
+        for service_id in {booking.service_id, None}:
+            stats, created = ServiceDurationStats.objects.select_for_update().get_or_create(
+                barber_id=booking.barber_id, service_id=service_id
+            )
+            _apply_samples(stats, [minutes])
+            stats.save()
+
+
+def rebuild_duration_stats(barber=None):
+    """Recompute all stats from completed bookings, for backfill or drift repair"""
+    bookings = Booking.objects.filter(
+        status='completed',
+        timer_started_at__isnull=False,
+        timer_ended_at__isnull=False
+    ).order_by('timer_ended_at')
+    stats_filter = {}
+    if barber is not None:
+        bookings = bookings.filter(barber=barber)
+        stats_filter['barber'] = barber
+
+    samples = {}
+    for booking in bookings.only('barber_id', 'service_id', 'timer_started_at', 'timer_ended_at').iterator(chunk_size=2000):
+        minutes = booking_duration_minutes(booking)
+        if minutes is None:
+            continue
+        for service_id in {booking.service_id, None}:
+            key = (booking.barber_id, service_id)
+            samples.setdefault(key, []).append(minutes)
+
+    rebuilt = []
+    for (barber_id, service_id), minutes in samples.items():
+        stats = ServiceDurationStats(barber_id=barber_id, service_id=service_id, recent_minutes=[], sample_count=0)
+        _apply_samples(stats, minutes[-ROLLING_WINDOW:])
+        stats.sample_count = len(minutes)
+        rebuilt.append(stats)
+
+    with transaction.atomic():
+        ServiceDurationStats.objects.filter(**stats_filter).delete()
+        ServiceDurationStats.objects.bulk_create(rebuilt)
+    return len(rebuilt)
+
+
+def _expected_minutes(booking, medians):
+    """Best guess at how long a booking will take"""
+    if booking.service_id in medians:
+        return medians[booking.service_id]
+    if booking.service_id:
+        return booking.service.duration_minutes
+    if None in medians:
+        return medians[None]
+    return DEFAULT_SERVICE_MINUTES
+
+
+def estimate_wait_times(barber, active_booking, queue, now=None):
+    """
+    Minutes until each waiting booking is likely to start, keyed by booking id.
+    The in-progress booking is keyed too, with the minutes it has left.
+    Reads the precomputed medians in one query.
+    """
+    now = now or timezone.now()
+    medians = dict(
+        ServiceDurationStats.objects.filter(barber=barber, median_minutes__isnull=False)
+        .values_list('service_id', 'median_minutes')
+    )
+
+    estimates = {}
+    elapsed = 0
+    if active_booking:
+        expected = _expected_minutes(active_booking, medians)
+        if active_booking.timer_started_at:
+            expected -= (now - active_booking.timer_started_at).total_seconds() / 60
+        elapsed = max(0, expected)
+        estimates[active_booking.pk] = round(elapsed)
+
+    for booking in queue:
+        estimates[booking.pk] = round(elapsed)
+        elapsed += _expected_minutes(booking, medians)
+    return estimates
@@ -68,6 +68,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts so concurrent bookings wait instead of failing
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
@@ -97,6 +101,24 @@ CSRF_TRUSTED_ORIGINS = [
     'https://8018de3f4a86.ngrok-free.app',
 ]
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend (Redis, Memcached or the database cache) when running several workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'barber-flow',
+    }
+}
+
+# Seconds a computed availability day stays cached (bookings invalidate it earlier)
+AVAILABILITY_CACHE_TIMEOUT = 60 * 60
+
+# Cache holding dashboard stats; point it at a file or database cache when running several workers
+DASHBOARD_CACHE_ALIAS = 'default'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -129,6 +151,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # BulkSMS Configuration (South Africa)
 BULKSMS_USERNAME = ''  # Add your BulkSMS username
 BULKSMS_PASSWORD = ''  # Add your BulkSMS password
+SITE_URL = ''  # Public address of the site for links in SMS, e.g. https://bookings.example.com
 
 
 AUTH_USER_MODEL = 'barber.Barber'